@@ -64,6 +64,24 @@ export const SocketProvider = ({ children }: { children: JSX.Element }) => {
 					if (data.type === 'pong') {
 						return
 					}
+					if (data.type === 'ping') {
+						// Пинг сервера: по ответу он меряет RTT и смещение часов
+						socket.send(
+							JSON.stringify({
+								type: 'pong',
+								id: data.id,
+								client_time: Date.now() / 1000,
+							})
+						)
+						return
+					}
+					if (data.type === 'fleet_frame') {
+						const robots: RobotData[] = data.robots || []
+						if (robots.length === 0) return
+						setRobotData(prev => Object.assign({ ...prev }, ...robots))
+						setMessages(prev => [...prev, ...robots])
+						return
+					}
 					setRobotData(prev => ({ ...prev, ...data }))
 					setMessages(prev => [...prev, data])
 				} catch (err) {
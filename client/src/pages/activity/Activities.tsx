@@ -79,13 +79,20 @@ export default function ActivitiesPage() {
 
 	// Функция загрузки задач с сервера
 	const fetchTasks = async (): Promise<Task[]> => {
-		const response = await axios.get(`${API_URL}/tasks/`)
-		const tasksFromServer = response.data.tasks
-
-		if (!Array.isArray(tasksFromServer)) {
-			console.warn('Получен некорректный формат данных:', tasksFromServer)
-			return []
-		}
+		// Сервер отдаёт задачи страницами — идём по next_after до конца
+		const tasksFromServer: any[] = []
+		let after: number | null = null
+		do {
+			const response = await axios.get(`${API_URL}/tasks/`, {
+				params: after === null ? {} : { after },
+			})
+			if (!Array.isArray(response.data.tasks)) {
+				console.warn('Получен некорректный формат данных:', response.data)
+				return []
+			}
+			tasksFromServer.push(...response.data.tasks)
+			after = response.data.next_after ?? null
+		} while (after !== null)
 
 		return tasksFromServer.map((task: any) => ({
 			id: task.task_id,
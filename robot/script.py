@@ -5,22 +5,38 @@ import platform
 import re
 import subprocess
 import time
+from collections import deque
 from queue import Empty, Queue
 from subprocess import PIPE
 from threading import Thread
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
 import psutil
 import serial
 import websockets
+from log_config import get_logger, setup_logging
 from Transbot_Lib import Transbot
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # ===== ИНИЦИАЛИЗАЦИЯ ==== #
+setup_logging()
+nav_log = get_logger("nav")
+gps_log = get_logger("gps")
+ws_log = get_logger("ws")
+
 bot = Transbot()
 bot.create_receive_threading()
 uri = "ws://192.168.1.130:8000/ws"
 session_id = "Transbot"
+ROBOT_ID = 1
+
+# ===== ПАРАМЕТРЫ ТЕЛЕМЕТРИИ ===== #
+TELEMETRY_KEYFRAME_INTERVAL = 20  # полный кадр раз в N отправок
 
 # ===== НАВИГАЦИОННЫЕ ПАРАМЕТРЫ ===== #
 POSITION_HISTORY_MAX = 10
@@ -229,7 +245,7 @@ def adjust_direction_based_on_history(target_bearing: float):
 
     # Корректируем угол, если отклонение превышает порог
     if abs(turn_angle) > TURN_ANGLE_THRESHOLD:
-        print(f"Adjusting direction by {smoothed_turn_angle:.1f}°")
+        nav_log.debug("Adjusting direction by %.1f°", smoothed_turn_angle)
         bot.set_car_motion(1, smoothed_turn_angle / 45)
     else:
         move_forward()
@@ -255,12 +271,89 @@ def is_topic_active(topic_name):
 def get_system_stats():
     return {
         "cpu_freq": psutil.cpu_freq().current if psutil.cpu_freq() else 0,
-        "cpu_usage": psutil.cpu_percent(interval=1),
+        # interval=None — загрузка с прошлого вызова, без блокировки цикла
+        "cpu_usage": psutil.cpu_percent(interval=None),
         "memory_usage": psutil.virtual_memory().percent,
         "disk_usage": psutil.disk_usage("/").percent,
     }
 
 
+# ===== КОДИРОВАНИЕ СООБЩЕНИЙ ===== #
+def decode_polyline(text: str) -> List[Dict[str, float]]:
+    """Маршрут polyline6 (разности координат ×1e6, zigzag, 5-битные группы) в точки."""
+    points = []
+    index = lat = lng = 0
+    while index < len(text):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(text[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append({"lat": lat / 1e6, "lng": lng / 1e6})
+    return points
+
+
+def encode_message(message: Dict[str, Any], binary: bool):
+    """Кодирует сообщение в msgpack (если подпротокол согласован) или JSON."""
+    if binary:
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message)
+
+
+def decode_message(frame) -> Dict[str, Any]:
+    """Декодирует кадр по его типу: бинарный — msgpack, текстовый — JSON."""
+    if isinstance(frame, bytes):
+        return msgpack.unpackb(frame, raw=False)
+    return json.loads(frame)
+
+
+# ===== ДЕЛЬТА-КОДИРОВАНИЕ ТЕЛЕМЕТРИИ ===== #
+class TelemetryEncoder:
+    """
+    Превращает полные словари телеметрии в кадры дельта-протокола.
+
+    Ключевой кадр (telemetry_key) несёт всё состояние и отправляется первым,
+    раз в keyframe_interval кадров и по запросу сервера (telemetry_resync).
+    Между ними уходят telemetry_delta только с изменившимися полями.
+    Поле seq растёт на единицу с каждым кадром, по нему сервер замечает разрыв.
+    """
+
+    def __init__(self, keyframe_interval: int = TELEMETRY_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.last_sent: Dict[str, Any] = {}
+        self.seq = 0
+        self.frames_since_key = 0
+        self.force_keyframe = True
+
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    def encode(self, telemetry: Dict[str, Any]) -> Dict[str, Any]:
+        self.seq += 1
+        if self.force_keyframe or self.frames_since_key >= self.keyframe_interval:
+            self.force_keyframe = False
+            self.frames_since_key = 0
+            self.last_sent = dict(telemetry)
+            return {"type": "telemetry_key", "seq": self.seq, "data": telemetry}
+
+        changed = {
+            field: value
+            for field, value in telemetry.items()
+            if self.last_sent.get(field) != value
+        }
+        self.last_sent.update(changed)
+        self.frames_since_key += 1
+        return {"type": "telemetry_delta", "seq": self.seq, "data": changed}
+
+
 # ===== КЛАСС GPS ЧТЕНИЯ ===== #
 class GPSReader(Thread):
     def __init__(self, data_queue: Queue):
@@ -274,16 +367,16 @@ class GPSReader(Thread):
     def run(self):
         try:
             ser = serial.Serial(self.serial_port, self.baudrate, timeout=1)
-            print("GPS Serial Opened! Baudrate=9600")
+            gps_log.info("GPS Serial Opened! Baudrate=9600")
             while self.running:
                 if self._read_gps_data(ser):
                     self.data_queue.put_nowait(self.gps_data)
         except Exception as e:
-            print(f"GPS Error: {e}")
+            gps_log.error("GPS Error: %s", e)
         finally:
             if "ser" in locals():
                 ser.close()
-            print("GPS serial closed")
+            gps_log.info("GPS serial closed")
 
     def _read_gps_data(self, ser):
         if ser.inWaiting():
@@ -344,14 +437,29 @@ async def websocket_sender(data_queue: Queue):
     global total_distance, trip_count, mission_start_time
     current_task = None
     current_target_index = 0
+    # Задачи из пакета new_tasks выполняются по очереди
+    pending_tasks = deque()
     mission_active = False
     last_update_time = time.time()
+    telemetry_encoder = TelemetryEncoder()
+    # RTT до сервера по его пингам, мс (сервер сообщает последнее измерение)
+    link_latency_ms = 0
 
     try:
-        async with websockets.connect(f"{uri}?session_id={session_id}") as ws:
-            await ws.send(json.dumps({"role": "robot"}))
-            response = await ws.recv()
-            print(f"Connected: {response}")
+        async with websockets.connect(
+            f"{uri}?session_id={session_id}",
+            subprotocols=["msgpack"] if msgpack else None,
+        ) as ws:
+            binary = ws.subprotocol == "msgpack"
+            await ws.send(
+                encode_message(
+                    # Маршруты задач — строкой polyline6, в 5–10 раз короче JSON
+                    {"role": "robot", "robot_id": ROBOT_ID, "geometry": "polyline6"},
+                    binary,
+                )
+            )
+            response = decode_message(await ws.recv())
+            ws_log.info("Connected: %s", response)
 
             while True:
                 try:
@@ -377,33 +485,52 @@ async def websocket_sender(data_queue: Queue):
                                 last_lat, last_lon, bearing, distance_traveled
                             )
                             update_position_history(lat, lon)
-                            print(f"Predicted position: ({lat}, {lon})")
+                            nav_log.debug("Predicted position: (%s, %s)", lat, lon)
 
                     last_update_time = time.time()
 
                     # Обработка миссии
+                    if current_task is None and pending_tasks:
+                        current_task = pending_tasks.popleft()
+                        current_target_index = 0
                     if current_task and current_task.get("route"):
                         if not mission_active:
                             mission_active = True
                             mission_start_time = time.time()
                             trip_count += 1
-                            print("Mission started!")
+                            nav_log.info("Mission started!")
 
                         target = current_task["route"][current_target_index]
                         target_lat = target.get("lat", 0.0)
                         target_lon = target.get("lng", 0.0)
                         distance = haversine_distance(lat, lon, target_lat, target_lon)
 
-                        print(f"🎯 Distance to target: {distance:.1f}m")
+                        nav_log.debug("🎯 Distance to target: %.1fm", distance)
 
                         if distance < MIN_MOVEMENT_DISTANCE:
-                            print(f"Reached point {current_target_index + 1}")
+                            nav_log.info("Reached point %d", current_target_index + 1)
                             stop_movement()
                             current_target_index += 1
+                            # Прогресс в процентах: операторам сразу, в базу — пачкой на сервере
+                            await ws.send(
+                                encode_message(
+                                    {
+                                        "type": "progress",
+                                        "task_id": current_task.get("id"),
+                                        "progress": round(
+                                            100
+                                            * current_target_index
+                                            / len(current_task["route"]),
+                                            1,
+                                        ),
+                                    },
+                                    binary,
+                                )
+                            )
                             if current_target_index >= len(current_task["route"]):
                                 mission_duration = time.time() - mission_start_time
-                                print(
-                                    f"Mission complete! Duration: {mission_duration:.1f}s"
+                                nav_log.info(
+                                    "Mission complete! Duration: %.1fs", mission_duration
                                 )
                                 current_task = None
                                 mission_active = False
@@ -427,9 +554,10 @@ async def websocket_sender(data_queue: Queue):
                         "cpu_frequency": psutil.cpu_freq().current
                         if psutil.cpu_freq()
                         else 0,
-                        "cpu_usage": psutil.cpu_percent(interval=1),
+                        # interval=None — загрузка с прошлого вызова, без блокировки цикла
+                        "cpu_usage": psutil.cpu_percent(interval=None),
                         "memory_usage": psutil.virtual_memory().percent,
-                        "data_exchange_latency": 0,
+                        "data_exchange_latency": link_latency_ms,
                         "total_distance": total_distance,
                         "avg_distance_per_task": total_distance / trip_count
                         if trip_count > 0
@@ -443,13 +571,13 @@ async def websocket_sender(data_queue: Queue):
                             "knots": gps_data.get("sog", ""),
                             "kph": gps_data.get("kph", ""),
                         },
-                        "robot_id": 1,
+                        "robot_id": ROBOT_ID,
                     }
 
-                    await ws.send(json.dumps(telemetry))
-                    print(
-                        f"📤 Данные отправлены: 📍 Координаты ({telemetry['coordinates']['lat']}, {telemetry['coordinates']['lng']})"
+                    await ws.send(
+                        encode_message(telemetry_encoder.encode(telemetry), binary)
                     )
+                    ws_log.debug("📤 Данные отправлены: 📍 Координаты (%s, %s)", lat, lon)
 
                 except Empty:
                     await asyncio.sleep(0.1)
@@ -457,20 +585,58 @@ async def websocket_sender(data_queue: Queue):
                 # Получение команд
                 try:
                     message = await asyncio.wait_for(ws.recv(), timeout=0.1)
-                    data = json.loads(message)
-                    if data.get("type") == "new_task":
-                        print("New mission received!")
+                    data = decode_message(message)
+                    if data.get("type") == "ping":
+                        # Отвечаем сразу: по ответу сервер меряет RTT и смещение часов
+                        await ws.send(
+                            encode_message(
+                                {
+                                    "type": "pong",
+                                    "id": data.get("id"),
+                                    "client_time": time.time(),
+                                },
+                                binary,
+                            )
+                        )
+                        if data.get("last_rtt_ms") is not None:
+                            link_latency_ms = data["last_rtt_ms"]
+                    elif data.get("type") == "telemetry_resync":
+                        telemetry_encoder.request_keyframe()
+                    elif data.get("type") == "new_task":
+                        if str(data.get("robot_id")) != str(ROBOT_ID):
+                            continue
+                        ws_log.info("New mission received!")
                         current_task = {
                             "id": data.get("task_id"),
-                            "route": data.get("route", []),
+                            "route": decode_polyline(data["polyline"])
+                            if "polyline" in data
+                            else data.get("route", []),
                         }
                         current_target_index = 0
+                    elif data.get("type") == "new_tasks":
+                        if str(data.get("robot_id")) != str(ROBOT_ID):
+                            continue
+                        routes = data.get("routes", {})
+                        for route_id, encoded in data.get("polylines", {}).items():
+                            routes[route_id] = decode_polyline(encoded)
+                        for task in data.get("tasks", []):
+                            pending_tasks.append(
+                                {
+                                    "id": task.get("task_id"),
+                                    "route": routes.get(str(task.get("route_id")), []),
+                                }
+                            )
+                        ws_log.info(
+                            "%d missions queued (%d pending)",
+                            len(data.get("tasks", [])),
+                            len(pending_tasks),
+                        )
                 except asyncio.TimeoutError:
                     pass
                 except Exception as e:
-                    print(f"Error receiving data: {e}")
+                    ws_log.warning("Error receiving data: %s", e)
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        ws_log.error("WebSocket error: %s", e)
 
 
 # ===== Новая функция прогнозирования ===== #
@@ -549,7 +715,7 @@ if __name__ == "__main__":
         loop = asyncio.get_event_loop()
         loop.run_until_complete(main())
     except KeyboardInterrupt:
-        print("Завершение работы...")
+        ws_log.info("Завершение работы...")
     finally:
         del bot
         if "loop" in locals():
@@ -0,0 +1,213 @@
+# backplane.py
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+from log_config import get_logger
+
+log = get_logger("backplane")
+
+Handler = Callable[[dict], None]
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class Backplane:
+    """
+    Шина между воркерами сервера. Каждое сообщение — dict, доставляется всем
+    остальным воркерам (собственные публикации отправителю не возвращаются).
+    """
+
+    def __init__(self):
+        self.worker_id = new_worker_id()
+        self.handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    async def publish(self, message: dict):
+        raise NotImplementedError
+
+    def _deliver(self, message: dict):
+        if message.get("origin") == self.worker_id or self.handler is None:
+            return
+        try:
+            self.handler(message)
+        except Exception as e:
+            log.exception("Ошибка обработки сообщения шины: %s", e)
+
+
+class LocalBackplane(Backplane):
+    """
+    Шина внутри одного процесса: несколько ConnectionManager с одним именем
+    хаба ведут себя как воркеры с общей шиной. Для проверок и бенчмарков
+    (benchmarks/cross_worker.py).
+    """
+
+    hubs: Dict[str, List["LocalBackplane"]] = {}
+
+    def __init__(self, hub: str = "default"):
+        super().__init__()
+        self.hub = hub
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self.hubs.setdefault(self.hub, []).append(self)
+
+    async def stop(self):
+        members = self.hubs.get(self.hub, [])
+        if self in members:
+            members.remove(self)
+        await super().stop()
+
+    async def publish(self, message: dict):
+        message = dict(message, origin=self.worker_id)
+        # Сериализация, как у настоящей шины: получатели не делят объекты
+        payload = json.dumps(message)
+        loop = asyncio.get_running_loop()
+        for member in list(self.hubs.get(self.hub, [])):
+            if member is not self:
+                loop.call_soon(member._deliver, json.loads(payload))
+
+
+class PostgresBackplane(Backplane):
+    """
+    Шина на LISTEN/NOTIFY. Приём идёт через add_reader на сокете отдельного
+    соединения, публикация — pg_notify в одном фоновом потоке, чтобы
+    сохранять порядок и не блокировать цикл событий. Сообщения длиннее
+    лимита NOTIFY (8000 байт) режутся на части и собираются на приёме.
+    """
+
+    MAX_PAYLOAD = 7500
+    CHUNK_TTL = 10.0
+
+    def __init__(self, connection_params: dict, channel: str = "robots_relay"):
+        super().__init__()
+        self.connection_params = connection_params
+        self.channel = channel
+        self._listen_conn = None
+        self._notify_conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._chunks: Dict[str, dict] = {}
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connection_params)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        loop = asyncio.get_running_loop()
+        self._listen_conn = await loop.run_in_executor(self._executor, self._connect)
+        self._notify_conn = await loop.run_in_executor(self._executor, self._connect)
+        with self._listen_conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel};")
+        loop.add_reader(self._listen_conn.fileno(), self._on_readable)
+        log.info("Шина Postgres: канал %s, воркер %s", self.channel, self.worker_id)
+
+    async def stop(self):
+        loop = asyncio.get_running_loop()
+        if self._listen_conn is not None:
+            loop.remove_reader(self._listen_conn.fileno())
+        for conn in (self._listen_conn, self._notify_conn):
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        self._listen_conn = self._notify_conn = None
+        self._executor.shutdown(wait=False)
+        await super().stop()
+
+    def _on_readable(self):
+        conn = self._listen_conn
+        try:
+            conn.poll()
+        except Exception as e:
+            log.error("Шина Postgres: ошибка приёма: %s", e)
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                message = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if "chunk" in message:
+                if message.get("origin") == self.worker_id:
+                    continue
+                message = self._assemble(message)
+                if message is None:
+                    continue
+            self._deliver(message)
+
+    def _assemble(self, part: dict) -> Optional[dict]:
+        now = time.monotonic()
+        # Части от упавшего отправителя не должны копиться бесконечно
+        for chunk_id in [
+            k for k, v in self._chunks.items() if now - v["at"] > self.CHUNK_TTL
+        ]:
+            del self._chunks[chunk_id]
+        entry = self._chunks.setdefault(part["chunk"], {"at": now, "parts": {}})
+        entry["parts"][part["i"]] = part["data"]
+        if len(entry["parts"]) < part["of"]:
+            return None
+        del self._chunks[part["chunk"]]
+        payload = "".join(entry["parts"][i] for i in range(part["of"]))
+        return json.loads(payload)
+
+    def _notify(self, payloads: List[str]):
+        with self._notify_conn.cursor() as cursor:
+            for payload in payloads:
+                cursor.execute("SELECT pg_notify(%s, %s);", (self.channel, payload))
+
+    async def publish(self, message: dict):
+        if self._notify_conn is None:
+            return
+        payload = json.dumps(dict(message, origin=self.worker_id))
+        if len(payload.encode()) <= self.MAX_PAYLOAD:
+            payloads = [payload]
+        else:
+            # json.dumps даёт ASCII; запас — на экранирование при повторной сериализации
+            size = self.MAX_PAYLOAD // 4
+            pieces = [payload[i : i + size] for i in range(0, len(payload), size)]
+            chunk_id = uuid.uuid4().hex
+            payloads = [
+                json.dumps(
+                    {
+                        "chunk": chunk_id,
+                        "i": i,
+                        "of": len(pieces),
+                        "data": piece,
+                        "origin": self.worker_id,
+                    }
+                )
+                for i, piece in enumerate(pieces)
+            ]
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._notify, payloads)
+        except Exception as e:
+            log.error("Шина Postgres: ошибка публикации: %s", e)
+
+
+def create_backplane(kind: str, connection_params: Optional[dict] = None):
+    kind = (kind or "none").lower()
+    if kind == "none":
+        return None
+    if kind == "local":
+        return LocalBackplane()
+    if kind == "postgres":
+        return PostgresBackplane(connection_params or {})
+    raise ValueError(f"Unknown backplane: {kind}")
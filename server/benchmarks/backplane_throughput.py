@@ -0,0 +1,158 @@
+"""
+Пропускная способность ретрансляции при 1, 2 и 4 воркерах uvicorn с шиной
+Postgres LISTEN/NOTIFY.
+
+Нужен доступный Postgres (параметры DB_* как у сервера). Для каждого числа
+воркеров запускается `uvicorn main:app --workers N`, к нему подключаются
+фейковые роботы, шлющие телеметрию без пауз, и операторы. Отчёт:
+- ingest, msg/s — кадров телеметрии, принятых сервером (отправка роботом
+  ждёт сокет, так что это предел обработки);
+- fleet, patch/s — патчей роботов, полученных операторами;
+- visible — доля роботов, которых видит каждый оператор: при нескольких
+  воркерах это проверяет, что данные проходят через шину.
+
+Запуск из каталога server:
+    python benchmarks/backplane_throughput.py [--robots 40] [--operators 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"Сервер не поднялся на порту {port}")
+
+
+async def fake_robot(url: str, robot_id: int, stop: asyncio.Event, counter: list):
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"role": "robot", "robot_id": robot_id}))
+        await ws.recv()
+        seq = 0
+        data = {
+            "robot_id": robot_id,
+            "deviceName": f"bench-{robot_id}",
+            "status": "Подключен",
+            "coordinates": {"lat": 55.75, "lng": 37.61},
+            "cpu_usage": 0.0,
+        }
+        await ws.send(json.dumps({"type": "telemetry_key", "seq": seq, "data": data}))
+        while not stop.is_set():
+            seq += 1
+            delta = {
+                "coordinates": {"lat": 55.75 + seq * 1e-6, "lng": 37.61},
+                "cpu_usage": seq % 100,
+            }
+            await ws.send(
+                json.dumps({"type": "telemetry_delta", "seq": seq, "data": delta})
+            )
+            counter[0] += 1
+
+
+async def fake_operator(url: str, stop: asyncio.Event, counter: list, seen: set):
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"role": "operator"}))
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            message = json.loads(frame)
+            if message.get("type") == "fleet_frame":
+                for patch in message["robots"]:
+                    seen.add(patch.get("robot_id"))
+                    counter[0] += 1
+
+
+async def measure(port: int, robots: int, operators: int, duration: float):
+    url = f"ws://127.0.0.1:{port}/ws"
+    stop = asyncio.Event()
+    ingest, fleet = [0], [0]
+    seen = [set() for _ in range(operators)]
+    tasks = [
+        asyncio.create_task(fake_operator(url, stop, fleet, seen[i]))
+        for i in range(operators)
+    ]
+    await asyncio.sleep(0.5)
+    tasks += [
+        asyncio.create_task(fake_robot(url, 10000 + i, stop, ingest))
+        for i in range(robots)
+    ]
+    # Прогрев: подключение всех и обмен снимками через шину
+    await asyncio.sleep(2.0)
+    ingest[0] = fleet[0] = 0
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - started
+    ingest_total, fleet_total = ingest[0], fleet[0]
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    visible = sum(len(s) for s in seen) / max(1, operators * robots)
+    return ingest_total / elapsed, fleet_total / elapsed, visible
+
+
+def run_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        WS_BACKPLANE="postgres" if workers > 1 else "none",
+        SESSION_BACKEND="postgres" if workers > 1 else "memory",
+        LOG_LEVEL="WARNING",
+    )
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=SERVER_DIR,
+        env=env,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--robots", type=int, default=40)
+    parser.add_argument("--operators", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'ingest, msg/s':>14} {'fleet, patch/s':>15} {'visible':>8}")
+    for workers in args.workers:
+        server = run_server(workers, args.port)
+        try:
+            wait_for_port(args.port)
+            ingest, fleet, visible = asyncio.run(
+                measure(args.port, args.robots, args.operators, args.duration)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{workers:>7} {ingest:>14.0f} {fleet:>15.0f} {visible:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+JSON против msgpack на типичных кадрах /ws: байты на кадр и время
+кодирования/декодирования.
+
+Запуск из каталога server:
+    python benchmarks/codec_bench.py [--number 20000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+TELEMETRY_KEY = {
+    "type": "telemetry_key",
+    "seq": 1024,
+    "data": {
+        "deviceName": "transbot-01",
+        "status": "Подключен",
+        "camera_ok": "OK",
+        "lidar_ok": "OK",
+        "current_voltage": 11.9,
+        "cpu_frequency": 1479.0,
+        "cpu_usage": 37.5,
+        "memory_usage": 61.2,
+        "data_exchange_latency": 0,
+        "total_distance": 1532.7781234,
+        "avg_distance_per_task": 306.55562468,
+        "trip_count": 5,
+        "coordinates": {"lat": 55.75581234567, "lng": 37.61764321098},
+        "speed": {"knots": "1.2", "kph": "2.3"},
+        "robot_id": 1,
+    },
+}
+
+TELEMETRY_DELTA = {
+    "type": "telemetry_delta",
+    "seq": 1025,
+    "data": {
+        "cpu_usage": 38.1,
+        "coordinates": {"lat": 55.75581334567, "lng": 37.61764421098},
+        "total_distance": 1532.8981234,
+    },
+}
+
+NEW_TASK = {
+    "type": "new_task",
+    "task_id": 42,
+    "route_id": 7,
+    "route": [
+        {"lat": 55.7558 + i * 1e-5, "lng": 37.6176 + i * 2e-5} for i in range(200)
+    ],
+    "robot_id": 1,
+    "start_time": "2024-05-01T08:00:00",
+    "description": "Объезд периметра",
+}
+
+FRAMES = {
+    "telemetry_key": TELEMETRY_KEY,
+    "telemetry_delta": TELEMETRY_DELTA,
+    "new_task (200 pts)": NEW_TASK,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    encodings = [codec.JSON]
+    if codec.msgpack is not None:
+        encodings.append(codec.MSGPACK)
+    else:
+        print("msgpack не установлен — сравнение только для JSON\n")
+
+    print(
+        f"{'frame':<20} {'enc':<8} {'bytes':>7} {'encode, us':>11} {'decode, us':>11}"
+    )
+    for name, obj in FRAMES.items():
+        number = args.number if name != "new_task (200 pts)" else args.number // 50
+        for encoding in encodings:
+            frame = codec.encode(obj, encoding)
+            size = len(frame.encode() if isinstance(frame, str) else frame)
+            encode_t = timeit.timeit(lambda: codec.encode(obj, encoding), number=number)
+            decode_t = timeit.timeit(lambda: codec.decode(frame), number=number)
+            print(
+                f"{name:<20} {encoding:<8} {size:>7} "
+                f"{encode_t / number * 1e6:>11.2f} {decode_t / number * 1e6:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Маршрутизация между воркерами на LocalBackplane: два ConnectionManager
+в одном процессе с общим хабом, оператор подключен к воркеру A, робот —
+к воркеру B. Проверяется, что через шину доходят:
+- сводка статусов: робот с B учтён в connected_robots на A;
+- телеметрия робота в кадрах парка оператора;
+- события робота (прогресс задачи) подписчикам на A;
+- задача, отправленная через A, до робота на B;
+- отключение робота — его id в offline кадра парка на A.
+
+Для каждой проверки печатается время доставки; если какая-то не прошла
+за --timeout секунд, код выхода 1.
+
+Запуск из каталога server:
+    python benchmarks/cross_worker.py [--timeout 2] [--fleet-hz 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backplane import LocalBackplane  # noqa: E402
+from connection_manager import ConnectionManager  # noqa: E402
+
+ROBOT_ID = "7"
+
+
+class FakeWebSocket:
+    def __init__(self, name: str):
+        self.client = name
+        self.received = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, message: str):
+        self.received.append(json.loads(message))
+
+
+async def wait_for(
+    ws: FakeWebSocket, match: Callable[[dict], bool], timeout: float
+) -> Optional[float]:
+    """Секунды до первого подходящего сообщения или None по таймауту."""
+    started = time.perf_counter()
+    seen = 0
+    while time.perf_counter() - started < timeout:
+        for message in ws.received[seen:]:
+            if match(message):
+                return time.perf_counter() - started
+        seen = len(ws.received)
+        await asyncio.sleep(0.005)
+    return None
+
+
+def fleet_robot(message: dict) -> bool:
+    return message.get("type") == "fleet_frame" and any(
+        str(robot.get("robot_id")) == ROBOT_ID and robot.get("cpu_usage") == 12
+        for robot in message["robots"]
+    )
+
+
+def fleet_offline(message: dict) -> bool:
+    return message.get("type") == "fleet_frame" and ROBOT_ID in message["offline"]
+
+
+async def run(timeout: float, fleet_hz: float) -> bool:
+    hub = f"cross-worker-{os.getpid()}"
+    worker_a = ConnectionManager(fleet_push_hz=fleet_hz, backplane=LocalBackplane(hub))
+    worker_b = ConnectionManager(fleet_push_hz=fleet_hz, backplane=LocalBackplane(hub))
+    await worker_a.start()
+    await worker_b.start()
+
+    operator = FakeWebSocket("operator@A")
+    robot = FakeWebSocket("robot@B")
+    await worker_a.connect(operator)
+    worker_a.register(operator, "operator")
+    await worker_b.connect(robot)
+    worker_b.register(robot, "robot", robot_id=ROBOT_ID)
+
+    results = []
+
+    async def check(name: str, ws: FakeWebSocket, match: Callable[[dict], bool]):
+        elapsed = await wait_for(ws, match, timeout)
+        results.append(elapsed is not None)
+        status = "FAIL" if elapsed is None else f"{elapsed * 1000:8.1f} ms"
+        print(f"{name:<32} {status}")
+
+    try:
+        await check(
+            "status summary A <- B",
+            operator,
+            lambda m: m.get("type") == "robot_status_summary"
+            and m.get("connected_robots") == 1,
+        )
+
+        worker_b.update_telemetry(robot, {"robot_id": ROBOT_ID, "cpu_usage": 12})
+        await check("fleet frame A <- B", operator, fleet_robot)
+
+        await worker_b.send_to_subscribers(
+            robot, {"type": "progress", "task_id": 1, "progress": 50.0}
+        )
+        await check(
+            "robot event A <- B", operator, lambda m: m.get("type") == "progress"
+        )
+
+        dispatched = await worker_a.send_to_robot(
+            ROBOT_ID, {"type": "new_task", "task_id": 1, "robot_id": ROBOT_ID}
+        )
+        results.append(dispatched)
+        await check("dispatch A -> B", robot, lambda m: m.get("type") == "new_task")
+
+        worker_b.disconnect(robot)
+        await check("offline A <- B", operator, fleet_offline)
+    finally:
+        worker_a.disconnect(operator)
+        await worker_a.stop()
+        await worker_b.stop()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--fleet-hz", type=float, default=20.0)
+    args = parser.parse_args()
+
+    ok = asyncio.run(run(args.timeout, args.fleet_hz))
+    print("\nOK" if ok else "\nFAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Нагрузочный тест /ws: N фейковых роботов и M операторов против сервера,
+запущенного локально в отдельном процессе. База не нужна — сервер
+поднимается с SQLite в памяти (benchmarks/sqlite_db.py).
+
+Роботы говорят тем же протоколом, что robot/script.py: рукопожатие с
+ролью, telemetry_key/telemetry_delta с seq, ответ на telemetry_resync и
+приём new_task. Тест дополнительно создаёт задачи через POST /tasks/.
+
+Отчёт:
+- ingest, msg/s — кадров телеметрии от роботов;
+- fleet, patch/s — патчей роботов, полученных операторами;
+- relay p50/p95/p99 — от отправки кадра роботом до прихода патча
+  оператору (включает ожидание тика рассылки, WS_FLEET_PUSH_HZ);
+- task p50/p99 — от POST /tasks/ до получения new_task роботом (с --bulk —
+  от POST /tasks/bulk до получения new_tasks);
+- CPU, µs/msg — процессорное время сервера на один входящий кадр;
+- RSS, MB — пиковая память процесса сервера.
+
+Запуск из каталога server:
+    python benchmarks/fleet_load.py [--robots 100] [--operators 10] [--rate 5]
+    python benchmarks/fleet_load.py --json results.jsonl   # для сравнения релизов
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TELEMETRY_KEYFRAME_INTERVAL = 20
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class ProcessSampler:
+    """Процессорное время и RSS процесса сервера из /proc (только Linux)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.peak_rss = 0
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime и stime — 14 и 15 поля, после имени процесса это 11 и 12
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def sample_rss(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    self.peak_rss = max(self.peak_rss, int(line.split()[1]) * 1024)
+                    return
+
+
+class Stats:
+    def __init__(self):
+        self.ingest = 0
+        self.patches = 0
+        self.relay = []
+        self.task_latency = []
+        self.resyncs = 0
+
+    def reset(self):
+        self.ingest = self.patches = self.resyncs = 0
+        self.relay.clear()
+        self.task_latency.clear()
+
+
+def telemetry(robot_id: int, seq: int) -> dict:
+    # Те же поля, что собирает robot/script.py
+    return {
+        "robot_id": robot_id,
+        "deviceName": f"bench-{robot_id}",
+        "status": "Подключен",
+        "coordinates": {"lat": 55.75 + seq * 1e-6, "lng": 37.61},
+        "speed": {"kph": f"{seq % 20:.1f}"},
+        "cpu_frequency": 1500,
+        "cpu_usage": seq % 100,
+        "memory_usage": 40.0,
+        "current_voltage": 12.0 - (seq % 50) * 0.01,
+        "data_exchange_latency": 0,
+        "sent_at": time.time(),
+    }
+
+
+async def fake_robot(
+    url: str, robot_id: int, rate: float, stop: asyncio.Event, stats: Stats
+):
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"role": "robot", "robot_id": robot_id}))
+        await ws.recv()
+        resync = asyncio.Event()
+
+        async def receive():
+            async for frame in ws:
+                message = json.loads(frame)
+                kind = message.get("type")
+                if kind == "telemetry_resync":
+                    stats.resyncs += 1
+                    resync.set()
+                elif kind == "new_task" and message.get("robot_id") == robot_id:
+                    # В описании задачи — момент отправки POST (часы этого процесса)
+                    sent = float(message["description"].split(":", 1)[1])
+                    stats.task_latency.append(time.perf_counter() - sent)
+                elif kind == "new_tasks" and message.get("robot_id") == robot_id:
+                    now = time.perf_counter()
+                    for task in message["tasks"]:
+                        sent = float(task["description"].split(":", 1)[1])
+                        stats.task_latency.append(now - sent)
+
+        receiver = asyncio.create_task(receive())
+        previous = {}
+        seq = 0
+        # Роботы стартуют вразнобой, как в реальном парке
+        await asyncio.sleep(random.random() / rate)
+        try:
+            while not stop.is_set():
+                data = telemetry(robot_id, seq)
+                if seq % TELEMETRY_KEYFRAME_INTERVAL == 0 or resync.is_set():
+                    resync.clear()
+                    frame = {"type": "telemetry_key", "seq": seq, "data": data}
+                else:
+                    delta = {k: v for k, v in data.items() if previous.get(k) != v}
+                    frame = {"type": "telemetry_delta", "seq": seq, "data": delta}
+                previous = data
+                await ws.send(json.dumps(frame))
+                stats.ingest += 1
+                seq += 1
+                await asyncio.sleep(1.0 / rate)
+        finally:
+            receiver.cancel()
+
+
+async def fake_operator(url: str, stop: asyncio.Event, stats: Stats):
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"role": "operator"}))
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            message = json.loads(frame)
+            if message.get("type") == "ping":
+                # Как веб-клиент: без ответов сервер закроет молчащее соединение
+                await ws.send(
+                    json.dumps(
+                        {
+                            "type": "pong",
+                            "id": message["id"],
+                            "client_time": time.time(),
+                        }
+                    )
+                )
+                continue
+            if message.get("type") != "fleet_frame":
+                continue
+            now = time.time()
+            for patch in message["robots"]:
+                stats.patches += 1
+                if "sent_at" in patch:
+                    stats.relay.append(now - patch["sent_at"])
+
+
+def bench_task(robots: int) -> dict:
+    return {
+        "route_id": 1,
+        "robot_id": random.randint(1, robots),
+        "start_time": "2024-01-01T00:00:00",
+        "description": f"bench:{time.perf_counter()}",
+    }
+
+
+async def task_dispatcher(
+    base: str, robots: int, rate: float, stop: asyncio.Event, bulk: int = 0
+):
+    if rate <= 0:
+        return
+    async with httpx.AsyncClient(base_url=base) as client:
+        while not stop.is_set():
+            if bulk:
+                # Пакет из bulk задач раз в bulk / rate секунд — тот же поток задач
+                tasks = [bench_task(robots) for _ in range(bulk)]
+                await client.post("/tasks/bulk", json={"tasks": tasks})
+                await asyncio.sleep(bulk / rate)
+            else:
+                await client.post("/tasks/", json=bench_task(robots))
+                await asyncio.sleep(1.0 / rate)
+
+
+async def measure(args, sampler: ProcessSampler) -> dict:
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    base = f"http://127.0.0.1:{args.port}"
+    stop = asyncio.Event()
+    stats = Stats()
+    tasks = [
+        asyncio.create_task(fake_operator(url, stop, stats))
+        for _ in range(args.operators)
+    ]
+    await asyncio.sleep(0.5)
+    tasks += [
+        asyncio.create_task(fake_robot(url, i + 1, args.rate, stop, stats))
+        for i in range(args.robots)
+    ]
+    tasks.append(
+        asyncio.create_task(
+            task_dispatcher(base, args.robots, args.task_rate, stop, args.bulk)
+        )
+    )
+    await asyncio.sleep(args.warmup)
+    stats.reset()
+    cpu_started = sampler.cpu_seconds()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        sampler.sample_rss()
+        await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - started
+    cpu = sampler.cpu_seconds() - cpu_started
+    ingest, patches = stats.ingest, stats.patches
+    relay, task_latency = list(stats.relay), list(stats.task_latency)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "robots": args.robots,
+        "operators": args.operators,
+        "rate": args.rate,
+        "bulk": args.bulk,
+        "ingest_per_s": ingest / elapsed,
+        "patches_per_s": patches / elapsed,
+        "relay_p50_ms": percentile(relay, 0.50) * 1000,
+        "relay_p95_ms": percentile(relay, 0.95) * 1000,
+        "relay_p99_ms": percentile(relay, 0.99) * 1000,
+        "task_p50_ms": percentile(task_latency, 0.50) * 1000,
+        "task_p99_ms": percentile(task_latency, 0.99) * 1000,
+        "resyncs": stats.resyncs,
+        "cpu_us_per_msg": cpu / max(1, ingest) * 1e6,
+        "cpu_load": cpu / elapsed,
+        "rss_mb": sampler.peak_rss / 2**20,
+    }
+
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"Сервер не поднялся на порту {port}")
+
+
+def serve(port: int, robots: int):
+    """Процесс сервера: SQLite вместо Postgres, без записи истории и шины."""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["TELEMETRY_PERSIST"] = "0"
+    os.environ["SESSION_BACKEND"] = "memory"
+    os.environ["WS_BACKPLANE"] = "none"
+    import sqlite_db
+    import uvicorn
+
+    sqlite_db.install(robots)
+    sys.path.insert(0, SERVER_DIR)
+    os.chdir(SERVER_DIR)
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def run_server(args) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--serve",
+            "--port",
+            str(args.port),
+            "--robots",
+            str(args.robots),
+        ],
+        cwd=SERVER_DIR,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--robots", type=int, default=100)
+    parser.add_argument("--operators", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=5.0, help="кадров/с на робота")
+    parser.add_argument("--task-rate", type=float, default=2.0, help="задач/с")
+    parser.add_argument(
+        "--bulk",
+        type=int,
+        default=0,
+        help="задач в одном POST /tasks/bulk; 0 — по одной",
+    )
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--json", help="дописать результат строкой JSON в файл")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.robots)
+        return
+
+    server = run_server(args)
+    try:
+        wait_for_port(args.port)
+        result = asyncio.run(measure(args, ProcessSampler(server.pid)))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(
+        f"robots={result['robots']} operators={result['operators']} "
+        f"rate={result['rate']}/s"
+    )
+    print(f"  ingest, msg/s     {result['ingest_per_s']:>10.0f}")
+    print(f"  fleet, patch/s    {result['patches_per_s']:>10.0f}")
+    print(
+        "  relay p50/p95/p99 "
+        f"{result['relay_p50_ms']:>10.1f} / {result['relay_p95_ms']:.1f} / "
+        f"{result['relay_p99_ms']:.1f} ms"
+    )
+    print(
+        f"  task p50/p99      {result['task_p50_ms']:>10.1f} / "
+        f"{result['task_p99_ms']:.1f} ms"
+    )
+    print(f"  resyncs           {result['resyncs']:>10}")
+    print(
+        f"  CPU, µs/msg       {result['cpu_us_per_msg']:>10.1f}"
+        f"  (load {result['cpu_load']:.0%})"
+    )
+    print(f"  RSS, MB           {result['rss_mb']:>10.1f}")
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps(dict(result, at=time.time())) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Задержка ретрансляции робот -> операторы при 1, 10 и 100 операторах,
+один из которых намеренно медленный.
+
+Запуск из каталога server:
+    python benchmarks/relay_latency.py [--messages 100] [--rate 50]
+
+Режим "sequential" воспроизводит прежнюю рассылку (await send_text по очереди)
+для сравнения с очередями на соединение.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_manager import ConnectionManager  # noqa: E402
+
+
+class FakeWebSocket:
+    def __init__(self, name: str, delay: float = 0.0):
+        self.client = name
+        self.delay = delay
+        self.latencies = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            # Переключение контекста, как при реальной записи в сокет
+            await asyncio.sleep(0)
+        # Сводки статусов и прочие служебные сообщения не учитываются
+        if not message.startswith("bench:"):
+            return
+        sent_at = float(message.split(":")[1])
+        self.latencies.append(time.perf_counter() - sent_at)
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(operators: int, messages: int, rate: float, slow_delay: float, mode: str):
+    manager = ConnectionManager(queue_size=64)
+    sockets = [FakeWebSocket(f"op-{i}") for i in range(operators - 1)]
+    slow = FakeWebSocket("op-slow", delay=slow_delay)
+    sockets.insert(len(sockets) // 2, slow)
+    for ws in sockets:
+        await manager.connect(ws)
+        manager.register(ws, "operator")
+
+    # Кадры робота приходят по расписанию; задержка считается от момента
+    # прихода, так что заблокированный цикл приёма тоже попадает в замер.
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    for i in range(messages):
+        arrived = started + i * interval
+        delay = arrived - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        message = f"bench:{arrived}:telemetry-{i}"
+        if mode == "sequential":
+            for ws in manager.operators:
+                await ws.send_text(message)
+        else:
+            await manager.send_to_operators(message)
+
+    # Даём очередям быстрых операторов опустеть
+    await asyncio.sleep(0.1)
+    for ws in sockets:
+        manager.disconnect(ws)
+
+    fast = [lat for ws in sockets if ws is not slow for lat in ws.latencies]
+    if operators == 1:
+        fast = slow.latencies
+    return fast, len(slow.latencies), manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=50.0)
+    parser.add_argument("--slow-delay", type=float, default=0.05)
+    parser.add_argument(
+        "--mode", choices=["queued", "sequential", "both"], default="both"
+    )
+    args = parser.parse_args()
+
+    modes = ["queued", "sequential"] if args.mode == "both" else [args.mode]
+    print(f"{'mode':<11} {'ops':>4} {'p50, ms':>9} {'p99, ms':>9} {'slow recv':>10}")
+    for mode in modes:
+        for operators in (1, 10, 100):
+            latencies, slow_received, _ = asyncio.run(
+                run(operators, args.messages, args.rate, args.slow_delay, mode)
+            )
+            print(
+                f"{mode:<11} {operators:>4} "
+                f"{percentile(latencies, 50) * 1000:>9.2f} "
+                f"{percentile(latencies, 99) * 1000:>9.2f} "
+                f"{slow_received:>10}"
+            )
+    print("\nДля 1 оператора он же и медленный; при >1 задержка считается по быстрым.")
+
+
+if __name__ == "__main__":
+    main()
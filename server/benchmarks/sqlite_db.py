@@ -0,0 +1,155 @@
+"""
+Замена Postgres на SQLite в памяти для нагрузочных тестов без базы.
+
+install() подменяет пул database.pool до импорта main:
+запросы обработчиков выполняются как есть, с заменой %s на ? и NOW() на
+CURRENT_TIMESTAMP; строки возвращаются словарями, как у RealDictCursor.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE,
+    password TEXT
+);
+CREATE TABLE robots (
+    robot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    commissioning_date TEXT,
+    last_maintenance_date TEXT,
+    service_life INTEGER
+);
+CREATE TABLE routes (
+    route_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    coordinates TEXT,
+    creation_date TEXT
+);
+CREATE TABLE tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    route_id INTEGER REFERENCES routes (route_id),
+    robot_id INTEGER REFERENCES robots (robot_id),
+    start_time TEXT,
+    end_time TEXT,
+    description TEXT,
+    progress REAL DEFAULT 0
+);
+"""
+
+# Колонки с JSON, которые Postgres отдаёт уже разобранными
+JSON_COLUMNS = {"coordinates"}
+
+_PLACEHOLDER = re.compile(r"%s")
+_NOW = re.compile(r"\bNOW\(\)", re.IGNORECASE)
+
+
+def _translate(query: str) -> str:
+    return _NOW.sub("CURRENT_TIMESTAMP", _PLACEHOLDER.sub("?", query))
+
+
+class Cursor:
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+        self._rows = []
+        self._names = []
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query: str, params=()):
+        self._cursor.execute(_translate(query), tuple(params or ()))
+        # Как клиентский курсор psycopg2: результат выбирается сразу, иначе
+        # SQLite не даст сделать commit до fetchone (INSERT ... RETURNING)
+        description = self._cursor.description
+        self._names = [d[0] for d in description] if description else []
+        self._rows = self._cursor.fetchall() if description else []
+
+    def _row(self, row):
+        result = dict(zip(self._names, row))
+        for name in JSON_COLUMNS & result.keys():
+            if isinstance(result[name], str):
+                result[name] = json.loads(result[name])
+        return result
+
+    def fetchone(self):
+        if not self._rows:
+            return None
+        return self._row(self._rows.pop(0))
+
+    def fetchmany(self, size: int = 1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows))
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Connection:
+    closed = 0
+
+    def __init__(self, path: str = ":memory:"):
+        # Автокоммит, как у соединений пула
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+
+    def cursor(self, *args, **kwargs):
+        return Cursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def seed(connection: Connection, robots: int, route_points: int = 200):
+    connection._conn.executescript(SCHEMA)
+    cursor = connection.cursor()
+    for i in range(robots):
+        cursor.execute(
+            "INSERT INTO robots (name, service_life) VALUES (%s, %s);",
+            (f"bench-{i + 1}", 1000),
+        )
+    coordinates = [
+        {"lat": 55.75 + i * 1e-4, "lng": 37.61 + i * 1e-4} for i in range(route_points)
+    ]
+    cursor.execute(
+        "INSERT INTO routes (name, coordinates, creation_date) VALUES (%s, %s, NOW());",
+        ("bench", json.dumps(coordinates)),
+    )
+    connection.commit()
+
+
+def install(robots: int = 100) -> Connection:
+    connection = Connection()
+    seed(connection, robots)
+    # Одно соединение SQLite на весь процесс — пул размером 1, запросы по очереди
+    # SQLite не знает PREPARE — запросы реестра идут обычным текстом
+    database.pool = database.ConnectionPool(
+        connect=lambda: connection, maxsize=1, prepare=False
+    )
+    return connection
@@ -0,0 +1,177 @@
+"""
+Воспроизведение записи трафика /ws (WS_RECORD=путь на сервере) против
+запущенного сервера.
+
+Каждое записанное соединение открывается заново в момент своего первого
+кадра и отправляет входящие кадры (рукопожатие, телеметрию, команды
+операторов) с исходными интервалами, делёнными на скорость. Исходящие
+кадры записи не отправляются — их заново порождает сервер; ответы
+сервера читаются и считаются, чтобы не упираться в буферы сокетов.
+
+Запуск из каталога server:
+    python benchmarks/wire_replay.py wire.bin --info
+    python benchmarks/wire_replay.py wire.bin [--speed 1|10|max] [--url ws://...]
+
+Отчёт: число соединений и кадров, длительность записи и воспроизведения
+и отставание отправки от расписания (p50/p99/max). При --speed max кадры
+идут без пауз, и важна скорость отправки — с какой сервер принимает нагрузку.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wire_recorder import CLOSE, SEGMENT, read_records  # noqa: E402
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load(path: str, segment: int = None):
+    """
+    Входящие кадры и закрытия по соединениям: {(сегмент, conn): [(ts, record)]}.
+    Сегменты идут подряд: время каждого следующего сдвигается на конец предыдущего.
+    """
+    connections = defaultdict(list)
+    index, offset, last = -1, 0.0, 0.0
+    for record in read_records(path):
+        if record.kind == SEGMENT:
+            index += 1
+            offset = last
+            continue
+        if segment is not None and index != segment:
+            continue
+        ts = offset + record.ts
+        last = max(last, ts)
+        if record.inbound or record.kind == CLOSE:
+            connections[(index, record.conn)].append((ts, record))
+    # Соединение без входящих кадров воспроизвести нечем
+    return {key: frames for key, frames in connections.items() if frames[0][1].inbound}
+
+
+def info(path: str):
+    segments, kinds, roles = 0, Counter(), Counter()
+    conns, size, duration = set(), 0, 0.0
+    for record in read_records(path):
+        if record.kind == SEGMENT:
+            segments += 1
+            continue
+        kinds[
+            "in" if record.inbound else "close" if record.kind == CLOSE else "out"
+        ] += 1
+        conns.add((segments, record.conn))
+        if record.kind == CLOSE:
+            roles[record.role or "unknown"] += 1
+        size += len(record.payload)
+        duration = max(duration, record.ts)
+    print(f"segments      {segments}")
+    print(f"connections   {len(conns)}  (closed: {dict(roles)})")
+    print(f"frames in     {kinds['in']}")
+    print(f"frames out    {kinds['out']}")
+    print(f"payload, MB   {size / 2**20:.1f}")
+    print(f"duration, s   {duration:.1f}  (самый длинный сегмент)")
+
+
+async def play_connection(
+    url: str, frames: list, speed: float, started: float, stats: dict
+):
+    async def wait_until(ts: float):
+        if speed <= 0:
+            return
+        target = started + ts / speed
+        delay = target - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        stats["lag"].append(time.perf_counter() - target)
+
+    await wait_until(frames[0][0])
+    binary = any(record.binary for _, record in frames)
+    subprotocols = ["msgpack"] if binary else None
+    try:
+        async with websockets.connect(
+            url, subprotocols=subprotocols, max_size=None
+        ) as ws:
+            stats["connections"] += 1
+
+            async def drain():
+                async for _ in ws:
+                    stats["received"] += 1
+
+            reader = asyncio.create_task(drain())
+            try:
+                for ts, record in frames:
+                    await wait_until(ts)
+                    if record.kind == CLOSE:
+                        break
+                    payload = (
+                        record.payload if record.binary else record.payload.decode()
+                    )
+                    await ws.send(payload)
+                    stats["sent"] += 1
+            finally:
+                reader.cancel()
+    except (OSError, websockets.WebSocketException) as e:
+        stats["errors"] += 1
+        print(f"Соединение прервано: {e}", file=sys.stderr)
+
+
+async def replay(args):
+    connections = load(args.path, args.segment)
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    stats = {"connections": 0, "sent": 0, "received": 0, "errors": 0, "lag": []}
+    recorded = max((frames[-1][0] for frames in connections.values()), default=0.0)
+    first = min((frames[0][0] for frames in connections.values()), default=0.0)
+    # Запись начинается с первого кадра, а не с запуска сервера
+    connections = {
+        key: [(ts - first, record) for ts, record in frames]
+        for key, frames in connections.items()
+    }
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            play_connection(args.url, frames, speed, started, stats)
+            for frames in connections.values()
+        )
+    )
+    elapsed = time.perf_counter() - started
+    lag = stats["lag"]
+    print(f"speed         {args.speed}")
+    print(f"connections   {stats['connections']}  (errors: {stats['errors']})")
+    print(f"frames sent   {stats['sent']}  ({stats['sent'] / elapsed:.0f}/s)")
+    print(f"frames recv   {stats['received']}")
+    print(f"recorded, s   {recorded - first:.1f}")
+    print(f"replayed, s   {elapsed:.1f}")
+    print(
+        "lag p50/p99/max, ms "
+        f"{percentile(lag, 0.5) * 1000:.1f} / {percentile(lag, 0.99) * 1000:.1f} / "
+        f"{max(lag, default=0.0) * 1000:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    parser.add_argument("--speed", default="1", help="1, 10, ... или max")
+    parser.add_argument("--segment", type=int, help="номер сегмента (запуска сервера)")
+    parser.add_argument("--info", action="store_true", help="только сводка по записи")
+    args = parser.parse_args()
+    if args.info:
+        info(args.path)
+    else:
+        asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# codec.py
+import json
+from typing import Any, Dict, Iterable, Optional, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+# Подпротоколы, которые сервер готов принять, в порядке предпочтения
+SUBPROTOCOLS = [MSGPACK] if msgpack is not None else []
+
+Frame = Union[str, bytes]
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def negotiate(requested: Iterable[str]) -> Optional[str]:
+    requested = list(requested or [])
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in requested:
+            return subprotocol
+    return None
+
+
+def frame_encoding(frame: Frame) -> str:
+    # Бинарные кадры — msgpack, текстовые — JSON, независимо от подпротокола
+    return MSGPACK if isinstance(frame, (bytes, bytearray)) else JSON
+
+
+def encode(obj: Any, encoding: str = JSON) -> Frame:
+    if encoding == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj)
+
+
+def decode(frame: Frame) -> Any:
+    try:
+        if frame_encoding(frame) == MSGPACK:
+            if msgpack is None:
+                raise DecodeError("msgpack is not installed")
+            return msgpack.unpackb(frame, raw=False)
+        return json.loads(frame)
+    except DecodeError:
+        raise
+    except Exception as e:
+        raise DecodeError(str(e)) from e
+
+
+class Payload:
+    """
+    Сообщение для рассылки: объект и/или уже закодированный кадр.
+
+    Кодирование выполняется лениво и не больше одного раза на формат, так что
+    кадр, пришедший в JSON, уходит JSON-получателям как есть, а msgpack-версия
+    строится только если среди получателей есть msgpack-соединения.
+    """
+
+    __slots__ = ("_obj", "_frames")
+
+    def __init__(self, obj: Any = None, frame: Optional[Frame] = None):
+        self._obj = obj
+        self._frames: Dict[str, Frame] = {}
+        if frame is not None:
+            self._frames[frame_encoding(frame)] = frame
+
+    @classmethod
+    def wrap(cls, message: Union["Payload", Frame, dict]) -> "Payload":
+        if isinstance(message, Payload):
+            return message
+        if isinstance(message, (str, bytes, bytearray)):
+            return cls(frame=message)
+        return cls(obj=message)
+
+    @property
+    def obj(self) -> Any:
+        if self._obj is None:
+            self._obj = decode(next(iter(self._frames.values())))
+        return self._obj
+
+    def encoded(self, encoding: str) -> Frame:
+        frame = self._frames.get(encoding)
+        if frame is None:
+            frame = encode(self.obj, encoding)
+            self._frames[encoding] = frame
+        return frame
+
+    def __str__(self):
+        frame = self._frames.get(JSON)
+        return frame if frame is not None else str(self.obj)
+
+
+async def receive_frame(websocket: WebSocket) -> Frame:
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return message["text"]
+    return message["bytes"]
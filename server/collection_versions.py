@@ -0,0 +1,40 @@
+# collection_versions.py
+import itertools
+import uuid
+from typing import Dict, Iterable, Optional
+
+
+class CollectionVersions:
+    """
+    Версии коллекций для ETag. Версия — не число, а метка изменения:
+    префикс воркера и его счётчик. Новая метка расходится по шине, и все
+    воркеры отдают одну и ту же; у только что запущенного воркера метки
+    свои, так что старый ETag клиента с ними не совпадёт.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.prefix = uuid.uuid4().hex[:8]
+        self._counter = itertools.count()
+        self.tags: Dict[str, str] = {name: self._new_tag() for name in names}
+
+    def _new_tag(self) -> str:
+        return f"{self.prefix}.{next(self._counter)}"
+
+    def bump(self, name: str) -> str:
+        tag = self.tags[name] = self._new_tag()
+        return tag
+
+    def set(self, name: str, tag: str):
+        if name in self.tags:
+            self.tags[name] = tag
+
+    def etag(self, name: str) -> str:
+        return f'W/"{name}-{self.tags[name]}"'
+
+    def matches(self, name: str, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        etag = self.etag(name)
+        candidates = [c.strip() for c in if_none_match.split(",")]
+        # Слабое сравнение: W/ не учитывается
+        return any(c == "*" or c.removeprefix("W/") == etag[2:] for c in candidates)
@@ -0,0 +1,847 @@
+# connection_manager.py
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Set, Union
+
+import codec
+import polyline
+from backplane import Backplane
+from codec import Frame, Payload
+from collection_versions import CollectionVersions
+from fastapi import WebSocket
+from link_stats import LinkStats
+from log_config import get_logger
+from outbound import DROP_OLDEST, OVERFLOW_POLICIES, OutboundChannel
+from route_cache import RouteCache
+from subscriptions import ALL, SubscriptionIndex, SubscriptionKey, project
+from telemetry_history import TelemetryHistory
+from telemetry_store import TelemetryWriter, sample_from_snapshot
+from timing_wheel import TimingWheel
+from wire_recorder import INBOUND, OUTBOUND, WireRecorder
+
+Message = Union[Payload, Frame, dict]
+
+log = get_logger("ws.conn")
+relay_log = get_logger("relay")
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        queue_size: int = 256,
+        overflow_policy: str = DROP_OLDEST,
+        fleet_push_hz: float = 5.0,
+        status_debounce: float = 0.0,
+        backplane: Optional[Backplane] = None,
+        backplane_heartbeat: float = 5.0,
+        telemetry_writer: Optional[TelemetryWriter] = None,
+        history: Optional[TelemetryHistory] = None,
+        recorder: Optional[WireRecorder] = None,
+        ping_interval: float = 5.0,
+        robot_idle_timeout: float = 15.0,
+        operator_idle_timeout: float = 90.0,
+        reaper_tick: float = 1.0,
+        route_cache: Optional[RouteCache] = None,
+        versions: Optional[CollectionVersions] = None,
+    ):
+        self.robots: List[WebSocket] = []
+        self.operators: List[WebSocket] = []
+        self.robot_statuses: Dict[str, str] = {}
+        # robot_id из рукопожатия -> сокет робота и обратно
+        self.robots_by_id: Dict[str, WebSocket] = {}
+        self.robot_ids: Dict[WebSocket, str] = {}
+        self.channels: Dict[WebSocket, OutboundChannel] = {}
+        # Формат кадров, согласованный при рукопожатии (json по умолчанию)
+        self.encodings: Dict[WebSocket, str] = {}
+        # Роботы, принимающие маршруты строкой polyline6 (geometry в рукопожатии)
+        self.polyline_robots: Set[WebSocket] = set()
+        self.queue_size = queue_size
+        # Проверяется здесь, а не в OutboundChannel: опечатка в настройке
+        # должна остановить запуск, а не каждое соединение после рукопожатия
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.overflow_policy = overflow_policy
+        # Последний кадр телеметрии каждого робота; промежуточные кадры
+        # между тиками рассылки перезаписываются и операторам не уходят
+        self.snapshots: Dict[str, dict] = {}
+        # Поля, изменившиеся с прошлого тика: операторам уходят только они
+        self.dirty_robots: Dict[str, Set[str]] = {}
+        # Дельта-протокол: последний seq робота и ожидающие ключевого кадра
+        self.telemetry_seq: Dict[str, int] = {}
+        self.resync_pending: Set[str] = set()
+        self.offline_robots: Set[str] = set()
+        # Гистограмма статусов ведётся инкрементно: O(1) на каждое изменение
+        self.status_counts: Dict[str, int] = {}
+        self.status_dirty = False
+        self.status_debounce = status_debounce
+        self._last_summary: Optional[dict] = None
+        self._summary_sent_at = 0.0
+        self.subscriptions = SubscriptionIndex()
+        self.fleet_push_interval = 1.0 / fleet_push_hz
+        self._fleet_pusher: Optional[asyncio.Task] = None
+        # Шина между воркерами: снимки роботов других воркеров, их сводки
+        # статусов и каталог robot_id -> воркер для адресной отправки задач
+        self.backplane = backplane
+        self.backplane_heartbeat = backplane_heartbeat
+        self.remote_keys: Dict[str, str] = {}
+        self.remote_workers: Dict[str, dict] = {}
+        self.remote_robots: Dict[str, str] = {}
+        self._local_status_changed = False
+        self._heartbeat_at = 0.0
+        self._publishing: Set[asyncio.Task] = set()
+        # История телеметрии пишется пачками в фоне, ретрансляцию не задерживает
+        self.telemetry_writer = telemetry_writer
+        # Последние минуты телеметрии каждого робота — для карты и графиков
+        self.history = history
+        # Необязательная запись всех кадров /ws для воспроизведения нагрузки
+        self.recorder = recorder
+        # Пинги сервера: RTT и смещение часов каждого соединения
+        self.ping_interval = ping_interval
+        self.link_stats: Dict[WebSocket, LinkStats] = {}
+        self._ping_ids = itertools.count(1)
+        self._pinger: Optional[asyncio.Task] = None
+        # Соединения без входящих кадров дольше таймаута роли закрываются.
+        # Кадр только обновляет last_seen; колесо проверяет соединение,
+        # когда подходит его срок, и при необходимости переносит его
+        self.idle_timeouts = {
+            "robot": robot_idle_timeout,
+            "operator": operator_idle_timeout,
+        }
+        self.last_seen: Dict[WebSocket, float] = {}
+        self.reaper_tick = reaper_tick
+        self.idle_wheel = TimingWheel(
+            tick=reaper_tick,
+            slots=int(max(robot_idle_timeout, operator_idle_timeout) / reaper_tick) + 2,
+        )
+        self._reaper: Optional[asyncio.Task] = None
+        # Молчащий оператор живёт за счёт ответов на пинги сервера; без пингов
+        # отличить его от оборванного соединения нельзя — проверка отключается
+        self.idle_reaping = ping_interval > 0
+        # Маршруты в памяти воркера; изменения расходятся по шине
+        self.route_cache = route_cache
+        # Метки версий коллекций REST для ETag — общие для всех воркеров
+        self.versions = versions
+
+    async def start(self):
+        if self.recorder is not None:
+            await self.recorder.start()
+        if self.telemetry_writer is not None:
+            await self.telemetry_writer.start()
+        if self.backplane is not None:
+            await self.backplane.start(self.handle_backplane)
+            self._publish({"kind": "sync_request"})
+            self._publish_status()
+        if self._fleet_pusher is None:
+            self._fleet_pusher = asyncio.create_task(self.run_fleet_pusher())
+        if self._pinger is None and self.ping_interval > 0:
+            self._pinger = asyncio.create_task(self.run_pinger())
+        if not self.idle_reaping:
+            log.warning(
+                "Пинги отключены (ping_interval=0) — молчащие соединения не закрываются"
+            )
+        elif self._reaper is None:
+            self._reaper = asyncio.create_task(self.run_reaper())
+
+    async def stop(self):
+        if self.backplane is not None:
+            await self.backplane.publish({"kind": "shutdown"})
+            await self.backplane.stop()
+        for task in (self._fleet_pusher, self._pinger, self._reaper):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._fleet_pusher = self._pinger = self._reaper = None
+        if self.telemetry_writer is not None:
+            await self.telemetry_writer.stop()
+        if self.recorder is not None:
+            await self.recorder.stop()
+
+    async def connect(self, websocket: WebSocket, subprotocol: Optional[str] = None):
+        await websocket.accept(subprotocol=subprotocol)
+        self.encodings[websocket] = subprotocol or codec.JSON
+        channel = OutboundChannel(
+            websocket,
+            maxsize=self.queue_size,
+            policy=self.overflow_policy,
+            on_close=self.disconnect,
+            tap=self._record_outbound if self.recorder is not None else None,
+        )
+        self.channels[websocket] = channel
+        self.link_stats[websocket] = LinkStats()
+        self._watch_idle(websocket)
+        channel.start()
+        log.info(
+            "Новое подключение: %s (%s)", websocket.client, self.encodings[websocket]
+        )
+
+    def status_summary(self) -> dict:
+        return {
+            "type": "robot_status_summary",
+            "statuses": self.calculate_status_summary(),
+            "connected_robots": len(self.robots)
+            + sum(info["connected"] for info in self.remote_workers.values()),
+        }
+
+    async def send_status_summary(self):
+        await self.send_to_operators(self.status_summary())
+
+    async def push_status_summary(self):
+        """
+        Рассылает сводку, только если счётчики действительно изменились
+        (A -> B -> A за один тик не даёт рассылки), и не чаще status_debounce.
+        """
+        if not self.status_dirty:
+            return
+        now = time.monotonic()
+        if now - self._summary_sent_at < self.status_debounce:
+            return
+        self.status_dirty = False
+        summary = self.status_summary()
+        if summary == self._last_summary:
+            return
+        self._last_summary = summary
+        self._summary_sent_at = now
+        await self.send_to_operators(summary)
+
+    def calculate_status_summary(self):
+        summary = dict(self.status_counts)
+        for info in self.remote_workers.values():
+            for status, count in info["counts"].items():
+                summary[status] = summary.get(status, 0) + count
+        return summary
+
+    def _count_status(self, status: str, delta: int):
+        count = self.status_counts.get(status, 0) + delta
+        if count > 0:
+            self.status_counts[status] = count
+        else:
+            self.status_counts.pop(status, None)
+        self.status_dirty = True
+        self._local_status_changed = True
+
+    def record_inbound(self, websocket: WebSocket, frame: Frame):
+        self.last_seen[websocket] = time.monotonic()
+        channel = self.channels.get(websocket)
+        if channel is not None:
+            channel.received.inc()
+            channel.received_bytes.inc(len(frame))
+        if self.recorder is not None:
+            self.recorder.record(INBOUND, websocket, frame)
+
+    def _record_outbound(self, websocket: WebSocket, frame: Frame):
+        self.recorder.record(OUTBOUND, websocket, frame)
+
+    def register(self, websocket: WebSocket, role: str, robot_id=None, geometry=None):
+        if self.recorder is not None:
+            self.recorder.set_role(websocket, role)
+        channel = self.channels.get(websocket)
+        if channel is not None:
+            channel.set_role(role)
+        self._watch_idle(websocket)
+        if role == "robot":
+            self.robots.append(websocket)
+            if geometry == polyline.FORMAT:
+                self.polyline_robots.add(websocket)
+            self.robot_statuses[str(id(websocket))] = "unknown"
+            self._count_status("unknown", 1)
+            if robot_id is not None:
+                robot_id = str(robot_id)
+                # Переподключение: новый сокет вытесняет старый из индекса
+                previous = self.robots_by_id.get(robot_id)
+                if previous is not None and previous is not websocket:
+                    self.robot_ids.pop(previous, None)
+                self.robots_by_id[robot_id] = websocket
+                self.robot_ids[websocket] = robot_id
+            log.info("New ROB: %d (id=%s)", len(self.robots), robot_id)
+        elif role == "operator":
+            self.operators.append(websocket)
+            log.info("New OP: %d", len(self.operators))
+            self.subscriptions.add_default(websocket)
+            # Новый оператор сразу получает состояние парка, не дожидаясь кадров
+            self.send_snapshot(websocket)
+            self.send(websocket, self.status_summary())
+
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.robots:
+            self.robots.remove(websocket)
+            self.polyline_robots.discard(websocket)
+            ws_id = str(id(websocket))
+            if ws_id in self.robot_statuses:
+                self._count_status(self.robot_statuses.pop(ws_id), -1)
+            key = self.robot_key(websocket)
+            robot_id = self.robot_ids.pop(websocket, None)
+            if robot_id is not None and self.robots_by_id.get(robot_id) is websocket:
+                del self.robots_by_id[robot_id]
+            if robot_id is None or robot_id not in self.robots_by_id:
+                if self.snapshots.pop(key, None) is not None:
+                    self.offline_robots.add(key)
+                    self._publish({"kind": "offline", "robots": [key]})
+                self.dirty_robots.pop(key, None)
+                self.telemetry_seq.pop(key, None)
+                self.resync_pending.discard(key)
+        if websocket in self.operators:
+            self.operators.remove(websocket)
+            self.subscriptions.remove(websocket)
+        self.encodings.pop(websocket, None)
+        self.link_stats.pop(websocket, None)
+        self.last_seen.pop(websocket, None)
+        self.idle_wheel.cancel(websocket)
+        if self.recorder is not None:
+            self.recorder.close(websocket)
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            channel.close()
+
+    def robot_key(self, websocket: WebSocket) -> str:
+        return self.robot_ids.get(websocket) or str(id(websocket))
+
+    def _mark_dirty(self, key: str, fields):
+        self.dirty_robots.setdefault(key, set()).update(fields)
+        self.offline_robots.discard(key)
+
+    def update_telemetry(self, websocket: WebSocket, message: dict):
+        """Полный кадр телеметрии без типа (старый формат)."""
+        key = self.robot_key(websocket)
+        self.remote_keys.pop(key, None)
+        self.snapshots[key] = message
+        self._mark_dirty(key, message.keys())
+        self._record_telemetry(key)
+
+    def apply_telemetry_frame(self, websocket: WebSocket, frame: dict) -> bool:
+        """
+        Применяет telemetry_key (полное состояние) или telemetry_delta
+        (только изменившиеся поля). False — дельта не применима и роботу
+        нужно запросить ключевой кадр.
+        """
+        key = self.robot_key(websocket)
+        data = frame.get("data") or {}
+        seq = frame.get("seq")
+        self.remote_keys.pop(key, None)
+
+        if frame.get("type") == "telemetry_key":
+            # Операторы уже знают прежнее состояние — дальше идёт только разница
+            previous = self.snapshots.get(key) or {}
+            changed = [
+                f for f, v in data.items() if f not in previous or previous[f] != v
+            ]
+            self.snapshots[key] = dict(data)
+            self.resync_pending.discard(key)
+            if changed:
+                self._mark_dirty(key, changed)
+        else:
+            snapshot = self.snapshots.get(key)
+            expected = self.telemetry_seq.get(key)
+            if snapshot is None or expected is None or seq != expected + 1:
+                return False
+            if data:
+                snapshot.update(data)
+                self._mark_dirty(key, data.keys())
+
+        self.telemetry_seq[key] = seq
+        self._record_telemetry(key)
+        if "status" in data:
+            self.update_status(websocket, data["status"])
+        return True
+
+    def _record_telemetry(self, key: str):
+        if self.telemetry_writer is None and self.history is None:
+            return
+        sample = sample_from_snapshot(key, self.snapshots[key], time.time())
+        if self.history is not None:
+            self.history.append(sample)
+        if self.telemetry_writer is not None:
+            self.telemetry_writer.add(sample)
+
+    def request_keyframe(self, websocket: WebSocket):
+        key = self.robot_key(websocket)
+        if key in self.resync_pending:
+            return
+        self.resync_pending.add(key)
+        self.send(websocket, {"type": "telemetry_resync"})
+
+    def update_status(self, websocket: WebSocket, status: str):
+        ws_id = str(id(websocket))
+        previous = self.robot_statuses.get(ws_id)
+        if previous is None or previous == status:
+            return
+        self.robot_statuses[ws_id] = status
+        self._count_status(previous, -1)
+        self._count_status(status, 1)
+
+    def send_snapshot(self, websocket: WebSocket):
+        """Полное текущее состояние роботов из подписки оператора."""
+        subscription = self.subscriptions.keys.get(websocket, ALL)
+        _, _, fields = subscription
+        states = [
+            project(snapshot, fields)
+            for key, snapshot in self.snapshots.items()
+            if SubscriptionIndex.includes(subscription, key)
+        ]
+        if states:
+            frame = {
+                "type": "fleet_frame",
+                "robots": states,
+                "offline": [],
+                "server_time": time.time(),
+            }
+            self.send(websocket, frame)
+
+    def handle_subscription(self, websocket: WebSocket, message: dict):
+        """
+        {"type": "subscribe", "robot_ids": [...], "fields": ["position", ...]}
+        {"type": "unsubscribe", "robot_ids": [...]}
+        Отсутствующий robot_ids означает всех роботов, fields — все группы.
+        """
+        robot_ids = message.get("robot_ids")
+        try:
+            if message["type"] == "subscribe":
+                robots, excluded, _ = self.subscriptions.subscribe(
+                    websocket, robot_ids, message.get("fields")
+                )
+            else:
+                robots, excluded, _ = self.subscriptions.unsubscribe(
+                    websocket, robot_ids
+                )
+        except ValueError as e:
+            self.send(websocket, {"type": "subscription_error", "detail": str(e)})
+            return
+        self.send(
+            websocket,
+            {
+                "type": "subscription",
+                "robot_ids": None if robots is None else sorted(robots),
+                # При robot_ids: null — роботы, от которых оператор отписался
+                "excluded_robot_ids": sorted(excluded),
+                "fields": message.get("fields"),
+            },
+        )
+        if message["type"] == "subscribe":
+            self.send_snapshot(websocket)
+
+    def build_fleet_frames(self) -> Dict[SubscriptionKey, dict]:
+        """
+        Кадры парка для каждой различной подписки. Обходятся только изменившиеся
+        роботы, а получатели берутся из индекса robot_id -> подписки.
+        """
+        if not self.dirty_robots and not self.offline_robots:
+            return {}
+        now = time.time()
+        frames: Dict[SubscriptionKey, dict] = {}
+
+        def frame_for(key: SubscriptionKey) -> dict:
+            frame = frames.get(key)
+            if frame is None:
+                frame = {
+                    "type": "fleet_frame",
+                    "robots": [],
+                    "offline": [],
+                    "server_time": now,
+                }
+                frames[key] = frame
+            return frame
+
+        for robot, fields in self.dirty_robots.items():
+            snapshot = self.snapshots[robot]
+            patch = {"robot_id": snapshot.get("robot_id", robot)}
+            for field in fields:
+                if field in snapshot:
+                    patch[field] = snapshot[field]
+            # Проекция считается один раз на набор полей, а не на оператора
+            projections = {}
+            for key in self.subscriptions.keys_for_robot(robot):
+                _, _, allowed = key
+                projected = projections.get(allowed)
+                if projected is None:
+                    projected = project(patch, allowed)
+                    projections[allowed] = projected
+                if len(projected) > 1:
+                    frame_for(key)["robots"].append(projected)
+
+        for robot in self.offline_robots:
+            for key in self.subscriptions.keys_for_robot(robot):
+                frame_for(key)["offline"].append(robot)
+
+        self.dirty_robots.clear()
+        self.offline_robots.clear()
+        return frames
+
+    async def push_fleet_frame(self):
+        if self.backplane is not None:
+            self.sync_backplane()
+        await self.push_status_summary()
+        frames = self.build_fleet_frames()
+        for key, frame in frames.items():
+            # Одно кодирование на группу операторов с одинаковой подпиской
+            payload = Payload(frame)
+            for conn in list(self.subscriptions.members.get(key, ())):
+                self.send(conn, payload)
+
+    async def run_fleet_pusher(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.fleet_push_interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            try:
+                await self.push_fleet_frame()
+            except Exception as e:
+                log.exception("Ошибка рассылки кадра парка: %s", e)
+            # После долгой паузы не догоняем пропущенные тики пачкой
+            if loop.time() - next_tick > self.fleet_push_interval:
+                next_tick = loop.time()
+
+    def send(self, websocket: WebSocket, message: Message) -> bool:
+        """
+        Ставит сообщение в очередь соединения в его формате. message — dict,
+        готовый кадр (str для JSON, bytes для msgpack) или Payload; перекодирование
+        происходит только если формат кадра не совпадает с форматом соединения.
+        """
+        channel = self.channels.get(websocket)
+        if channel is None:
+            return False
+        payload = Payload.wrap(message)
+        encoding = self.encodings.get(websocket, codec.JSON)
+        return channel.put(payload.encoded(encoding))
+
+    async def send_to_operators(self, message: Message):
+        if not self.operators:
+            relay_log.debug("No OPs")
+            return
+
+        message = Payload.wrap(message)
+        if relay_log.isEnabledFor(logging.DEBUG):
+            relay_log.debug(
+                "Отправка операторам (%d шт): %s", len(self.operators), str(message)
+            )
+        # Копия списка: политика disconnect может удалить оператора по ходу рассылки
+        for conn in list(self.operators):
+            self.send(conn, message)
+
+    async def send_to_robots(self, message: Message):
+        message = Payload.wrap(message)
+        if self.backplane is not None:
+            self._publish({"kind": "robots", "message": message.obj})
+        if not self.robots:
+            return
+
+        if relay_log.isEnabledFor(logging.DEBUG):
+            relay_log.debug(
+                "Отправка роботам (%d шт): %s", len(self.robots), str(message)
+            )
+        for conn in list(self.robots):
+            self.send(conn, message)
+
+    async def send_to_subscribers(self, websocket: WebSocket, message: Message):
+        """События робота — только операторам, подписанным на этого робота."""
+        message = Payload.wrap(message)
+        robot = self.robot_key(websocket)
+        if self.backplane is not None:
+            self._publish({"kind": "event", "robot": robot, "message": message.obj})
+        self._send_to_local_subscribers(robot, message)
+
+    def _send_to_local_subscribers(self, robot: str, message: Message):
+        message = Payload.wrap(message)
+        for key in self.subscriptions.keys_for_robot(robot):
+            for conn in list(self.subscriptions.members.get(key, ())):
+                self.send(conn, message)
+
+    def get_robot(self, robot_id) -> Optional[WebSocket]:
+        return self.robots_by_id.get(str(robot_id))
+
+    async def send_to_robot(self, robot_id, message: Message) -> bool:
+        conn = self.get_robot(robot_id)
+        if conn is None:
+            worker = self.remote_robots.get(str(robot_id))
+            if worker is not None:
+                # Робот подключен к другому воркеру — доставит он
+                message = Payload.wrap(message).obj
+                self._publish(
+                    {"kind": "robot", "robot_id": str(robot_id), "message": message}
+                )
+                return True
+            log.warning("Робот %s не подключен", robot_id)
+            return False
+
+        if relay_log.isEnabledFor(logging.DEBUG):
+            relay_log.debug("Отправка роботу %s: %s", robot_id, str(message))
+        return self.send(conn, self._route_format(conn, message))
+
+    def _route_format(self, conn: WebSocket, message: Message) -> Message:
+        """
+        Маршруты в задачах идут строкой polyline6 ("polyline", "polylines");
+        роботу, не заявившему поддержку, они раскодируются в прежние
+        "route" и "routes" с массивами точек.
+        """
+        if conn in self.polyline_robots or not isinstance(message, dict):
+            return message
+        if "polyline" not in message and "polylines" not in message:
+            return message
+        message = dict(message)
+        if "polyline" in message:
+            message["route"] = self._decode_route(
+                message.get("route_id"), message.pop("polyline")
+            )
+        if "polylines" in message:
+            message["routes"] = {
+                route_id: self._decode_route(int(route_id), encoded)
+                for route_id, encoded in message.pop("polylines").items()
+            }
+        return message
+
+    def _decode_route(self, route_id: Optional[int], encoded: str):
+        # Раскодированные точки хранит кеш маршрутов, в пределах его бюджета
+        if self.route_cache is None or route_id is None:
+            return polyline.decode(encoded)
+        return self.route_cache.coordinates(route_id, encoded)
+
+    # ===== Шина между воркерами ===== #
+
+    def _publish(self, message: dict):
+        if self.backplane is None:
+            return
+        # Публикация не должна задерживать горячий путь — отдельной задачей
+        task = asyncio.create_task(self.backplane.publish(message))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    def _publish_status(self):
+        self._local_status_changed = False
+        self._heartbeat_at = time.monotonic()
+        self._publish(
+            {
+                "kind": "status",
+                "counts": dict(self.status_counts),
+                "connected": len(self.robots),
+                "robots": list(self.robots_by_id.keys()),
+            }
+        )
+
+    def _publish_fleet(self, full: bool = False):
+        robots = {}
+        if full:
+            for key, snapshot in self.snapshots.items():
+                if key not in self.remote_keys:
+                    robots[key] = snapshot
+        else:
+            for key, fields in self.dirty_robots.items():
+                if key in self.remote_keys:
+                    continue
+                snapshot = self.snapshots[key]
+                robots[key] = {f: snapshot[f] for f in fields if f in snapshot}
+        if robots:
+            self._publish({"kind": "fleet", "robots": robots})
+
+    def route_changed(self, route_id: int):
+        """Маршрут записан этим воркером — остальные сбрасывают его из кеша."""
+        self._publish({"kind": "route", "route_id": route_id})
+
+    def collection_changed(self, name: str):
+        """Коллекция изменилась: новая метка версии здесь и на остальных воркерах."""
+        if self.versions is None:
+            return
+        tag = self.versions.bump(name)
+        self._publish({"kind": "version", "collection": name, "tag": tag})
+
+    def _drop_worker(self, worker: str):
+        self.remote_workers.pop(worker, None)
+        for robot_id in [r for r, w in self.remote_robots.items() if w == worker]:
+            del self.remote_robots[robot_id]
+        for key in [k for k, w in self.remote_keys.items() if w == worker]:
+            del self.remote_keys[key]
+            self.snapshots.pop(key, None)
+            self.dirty_robots.pop(key, None)
+            self.offline_robots.add(key)
+        self.status_dirty = True
+
+    def sync_backplane(self):
+        """Раз в тик: свои изменения — в шину, молчащие воркеры — на выход."""
+        self._publish_fleet()
+        now = time.monotonic()
+        heartbeat_due = now - self._heartbeat_at >= self.backplane_heartbeat
+        if self._local_status_changed or heartbeat_due:
+            self._publish_status()
+        expired = [
+            worker
+            for worker, info in self.remote_workers.items()
+            if now - info["at"] > 3 * self.backplane_heartbeat
+        ]
+        for worker in expired:
+            log.warning("Воркер %s не отвечает, его роботы сняты", worker)
+            self._drop_worker(worker)
+
+    def handle_backplane(self, message: dict):
+        kind = message.get("kind")
+        origin = message.get("origin")
+
+        if kind == "fleet":
+            for key, patch in message["robots"].items():
+                if key in self.robots_by_id:
+                    continue
+                self.snapshots.setdefault(key, {}).update(patch)
+                self.remote_keys[key] = origin
+                self._mark_dirty(key, patch.keys())
+        elif kind == "offline":
+            for key in message["robots"]:
+                if self.remote_keys.get(key) == origin:
+                    del self.remote_keys[key]
+                    self.snapshots.pop(key, None)
+                    self.dirty_robots.pop(key, None)
+                    self.offline_robots.add(key)
+        elif kind == "status":
+            for robot_id in [r for r, w in self.remote_robots.items() if w == origin]:
+                del self.remote_robots[robot_id]
+            for robot_id in message["robots"]:
+                self.remote_robots[robot_id] = origin
+            self.remote_workers[origin] = {
+                "counts": message["counts"],
+                "connected": message["connected"],
+                "at": time.monotonic(),
+            }
+            self.status_dirty = True
+        elif kind == "sync_request":
+            # Новый воркер: полное состояние своих роботов и сводка
+            self._publish_fleet(full=True)
+            self._publish_status()
+        elif kind == "shutdown":
+            self._drop_worker(origin)
+        elif kind == "robot":
+            conn = self.robots_by_id.get(message["robot_id"])
+            if conn is not None:
+                self.send(conn, self._route_format(conn, message["message"]))
+        elif kind == "robots":
+            for conn in list(self.robots):
+                self.send(conn, message["message"])
+        elif kind == "event":
+            self._send_to_local_subscribers(message["robot"], message["message"])
+        elif kind == "route":
+            if self.route_cache is not None:
+                self.route_cache.invalidate(message["route_id"])
+        elif kind == "version":
+            if self.versions is not None:
+                self.versions.set(message["collection"], message["tag"])
+
+    async def handle_ping(self, websocket: WebSocket, data: dict):
+        if data.get("type") == "ping":
+            response = {
+                "type": "pong",
+                "timestamp": data["timestamp"],
+                "server_time": time.time(),
+            }
+            log.debug("Ping -pong")
+            self.send(websocket, response)
+        elif "id" in data:
+            # Ответ на пинг сервера
+            stats = self.link_stats.get(websocket)
+            if stats is not None:
+                stats.pong_received(data["id"], data.get("client_time"))
+
+    def send_pings(self):
+        now = time.time()
+        for websocket, stats in list(self.link_stats.items()):
+            ping_id = next(self._ping_ids)
+            stats.ping_sent(ping_id, now)
+            ping = {"type": "ping", "id": ping_id, "server_time": now}
+            # Клиент узнаёт измеренную сервером задержку (робот — для телеметрии)
+            if stats.last_rtt is not None:
+                ping["last_rtt_ms"] = round(stats.last_rtt * 1000, 2)
+            self.send(websocket, ping)
+
+    async def run_pinger(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                self.send_pings()
+            except Exception as e:
+                log.exception("Ошибка рассылки пингов: %s", e)
+
+    # ===== Закрытие молчащих соединений ===== #
+
+    def _idle_timeout(self, websocket: WebSocket) -> float:
+        channel = self.channels.get(websocket)
+        role = channel.role if channel is not None else "unknown"
+        # До рукопожатия действует таймаут робота — он короче
+        return self.idle_timeouts.get(role, self.idle_timeouts["robot"])
+
+    def _watch_idle(self, websocket: WebSocket):
+        if not self.idle_reaping:
+            return
+        now = time.monotonic()
+        self.last_seen.setdefault(websocket, now)
+        self.idle_wheel.schedule(websocket, now + self._idle_timeout(websocket))
+
+    def reap_idle(self, now: Optional[float] = None) -> List[WebSocket]:
+        now = time.monotonic() if now is None else now
+        expired = []
+        for websocket in self.idle_wheel.advance(now):
+            last_seen = self.last_seen.get(websocket)
+            if last_seen is None:
+                continue
+            deadline = last_seen + self._idle_timeout(websocket)
+            if deadline > now:
+                self.idle_wheel.schedule(websocket, deadline)
+                continue
+            expired.append(websocket)
+            log.info(
+                "Соединение %s молчит %.0f с — закрываем",
+                self.client_label(websocket),
+                now - last_seen,
+            )
+            self.disconnect(websocket)
+            asyncio.create_task(self._close_idle(websocket))
+        return expired
+
+    async def _close_idle(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1001)
+        except Exception:
+            pass
+
+    async def run_reaper(self):
+        while True:
+            await asyncio.sleep(self.reaper_tick)
+            try:
+                if self.reap_idle():
+                    # Сводка статусов уходит операторам сразу, не дожидаясь тика
+                    await self.push_status_summary()
+            except Exception as e:
+                log.exception("Ошибка проверки соединений: %s", e)
+
+    @staticmethod
+    def client_label(websocket: WebSocket) -> str:
+        client = websocket.client
+        if hasattr(client, "host"):
+            return f"{client.host}:{client.port}"
+        return str(client)
+
+    def link_summary(self) -> List[dict]:
+        links = []
+        for websocket, stats in self.link_stats.items():
+            channel = self.channels.get(websocket)
+            role = channel.role if channel is not None else "unknown"
+            links.append(
+                {
+                    "role": None if role == "unknown" else role,
+                    "robot_id": self.robot_ids.get(websocket),
+                    "client": self.client_label(websocket),
+                    **stats.summary(),
+                }
+            )
+        return links
+
+    def queue_depths(self):
+        """Для метрик: ((роль, клиент), длина исходящей очереди)."""
+        return [
+            ((channel.role, self.client_label(ws)), len(channel.queue))
+            for ws, channel in list(self.channels.items())
+        ]
+
+    def queue_drops(self):
+        return [
+            ((channel.role, self.client_label(ws)), channel.dropped)
+            for ws, channel in list(self.channels.items())
+        ]
@@ -1,7 +1,15 @@
+import asyncio
 import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, List, NamedTuple, Optional, Set, Union
 
+import metrics
 import psycopg2
+import psycopg2.errors
+from log_config import get_logger
 from psycopg2.extras import RealDictCursor
 
 try:
@@ -11,76 +19,369 @@ try:
 except Exception:
     pass
 
+log = get_logger("db")
 
-class Database:
-    def __init__(self):
-        self.connection = None
-        self.cursor = None
+# Ошибки, после которых соединение считается испорченным и закрывается
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
 
-    def connect(self):
-        while True:
+
+def connection_params() -> dict:
+    return {
+        "database": os.getenv("DB_NAME", "postgres"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+    }
+
+
+def connect_postgres():
+    connection = psycopg2.connect(**connection_params(), cursor_factory=RealDictCursor)
+    # Каждый запрос — своя транзакция; многооператорные записи идут одним запросом
+    connection.autocommit = True
+    return connection
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class Statement(NamedTuple):
+    name: str
+    query: str
+    prepare: str
+    execute: str
+
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+def statement(name: str, query: str) -> Statement:
+    """
+    Запрос из реестра частых запросов: на каждом соединении пула он один раз
+    готовится PREPARE и дальше выполняется по имени через EXECUTE, без
+    повторного разбора и планирования. Параметры — %s, как в обычных запросах.
+    """
+    count = 0
+
+    def number(match):
+        nonlocal count
+        count += 1
+        return f"${count}"
+
+    body = _PLACEHOLDER.sub(number, query.strip().rstrip(";"))
+    args = f" ({', '.join(['%s'] * count)})" if count else ""
+    return Statement(
+        name, query, f"PREPARE {name} AS {body};", f"EXECUTE {name}{args};"
+    )
+
+
+class PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.monotonic()
+        self.broken = False
+        # Имена подготовленных на этом соединении запросов; у нового
+        # соединения пусто — запросы готовятся заново при первом вызове
+        self.prepared: Set[str] = set()
+
+
+class Db:
+    """
+    Соединение из пула на время одного запроса. Каждый вызов берёт свой
+    курсор и выполняется в потоке пула, не блокируя цикл событий.
+    """
+
+    def __init__(self, pool: "ConnectionPool", pooled: PooledConnection):
+        self.pool = pool
+        self.pooled = pooled
+
+    @property
+    def connection(self):
+        return self.pooled.connection
+
+    async def run(self, fn: Callable, *args):
+        """fn(connection, *args) в потоке пула — для курсоров с особыми настройками."""
+        try:
+            return await self.pool.run(fn, self.connection, *args)
+        except CONNECTION_ERRORS:
+            self.pooled.broken = True
+            raise
+
+    @staticmethod
+    def _result(cursor, fetch: Optional[str]):
+        if fetch == "one":
+            return cursor.fetchone()
+        if fetch == "all":
+            return cursor.fetchall()
+        return cursor.rowcount
+
+    @staticmethod
+    def _execute(connection, query: str, params, fetch: Optional[str]):
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return Db._result(cursor, fetch)
+
+    @staticmethod
+    def _execute_prepared(
+        connection, prepared: Set[str], stmt: Statement, params, fetch: Optional[str]
+    ):
+        with connection.cursor() as cursor:
+            if stmt.name not in prepared:
+                cursor.execute(stmt.prepare)
+                prepared.add(stmt.name)
+                metrics.DB_STATEMENTS_PREPARED.inc()
+            try:
+                cursor.execute(stmt.execute, params)
+            except psycopg2.errors.InvalidSqlStatementName:
+                # Сервер забыл подготовленные запросы (DISCARD ALL у пулера,
+                # переподключение за балансировщиком) — готовим заново
+                prepared.clear()
+                cursor.execute(stmt.prepare)
+                prepared.add(stmt.name)
+                metrics.DB_STATEMENTS_PREPARED.inc()
+                cursor.execute(stmt.execute, params)
+            return Db._result(cursor, fetch)
+
+    async def _query(self, query: Union[str, Statement], params, fetch: Optional[str]):
+        if not isinstance(query, Statement):
+            return await self.run(self._execute, query, params, fetch)
+        if not self.pool.prepare:
+            return await self.run(self._execute, query.query, params, fetch)
+        return await self.run(
+            self._execute_prepared, self.pooled.prepared, query, params, fetch
+        )
+
+    async def execute(self, query: Union[str, Statement], params=None) -> int:
+        return await self._query(query, params, None)
+
+    async def fetchone(self, query: Union[str, Statement], params=None):
+        return await self._query(query, params, "one")
+
+    async def fetchall(self, query: Union[str, Statement], params=None) -> List[Any]:
+        return await self._query(query, params, "all")
+
+    @staticmethod
+    def _open_stream(connection, query: str, params, size: int):
+        # Серверный курсор живёт только внутри транзакции
+        connection.autocommit = False
+        cursor = connection.cursor(name="stream")
+        cursor.itersize = size
+        cursor.execute(query, params)
+        return cursor
+
+    @staticmethod
+    def _close_stream(connection, cursor):
+        cursor.close()
+        connection.commit()
+        connection.autocommit = True
+
+    async def stream(
+        self, query: str, params=None, size: int = 1000
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Строки пачками по size через серверный курсор и fetchmany: в памяти
+        процесса не больше одной пачки, сколько бы строк ни вернул запрос.
+
+        Пока поток открыт, соединение помечено испорченным: ошибка или отмена
+        (клиент ушёл посреди выгрузки) не вернут в пул соединение с открытой
+        транзакцией. Пометка снимается только после успешного закрытия.
+        """
+        self.pooled.broken = True
+        cursor = await self.run(self._open_stream, query, params, size)
+        try:
+            while True:
+                rows = await self.run(lambda _: cursor.fetchmany(size))
+                if not rows:
+                    break
+                yield rows
+        finally:
             try:
-                self.connection = psycopg2.connect(
-                    database=os.getenv("DB_NAME", "postgres"),
-                    user=os.getenv("DB_USER", "postgres"),
-                    password=os.getenv("DB_PASSWORD", ""),
-                    host=os.getenv("DB_HOST", "localhost"),
-                    port=os.getenv("DB_PORT", "5432"),
-                    cursor_factory=RealDictCursor,
+                await self.run(self._close_stream, cursor)
+            except Exception:
+                # Соединение в неизвестном состоянии транзакции — в пул не вернётся
+                pass
+            else:
+                self.pooled.broken = False
+
+
+class ConnectionPool:
+    """
+    Пул синхронных соединений psycopg2, которые работают через отдельный
+    ограниченный executor (потоков столько же, сколько соединений).
+
+    Соединение, простоявшее дольше health_check_after, перед выдачей
+    проверяется SELECT 1; испорченное закрывается и заменяется новым.
+    Подключение повторяется connect_attempts раз с нарастающей паузой,
+    после чего запрос получает DatabaseUnavailable, а не ждёт вечно.
+
+    prepare=False выполняет запросы реестра как обычный текст — для баз
+    без PREPARE/EXECUTE.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any] = connect_postgres,
+        maxsize: int = 10,
+        acquire_timeout: float = 10.0,
+        health_check_after: float = 30.0,
+        connect_attempts: int = 3,
+        connect_backoff: float = 0.5,
+        prepare: bool = True,
+    ):
+        self.connect = connect
+        self.maxsize = maxsize
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.connect_attempts = connect_attempts
+        self.connect_backoff = connect_backoff
+        self.prepare = prepare
+        self.idle: List[PooledConnection] = []
+        self.size = 0
+        self.in_use = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=maxsize, thread_name_prefix="db"
+        )
+
+    async def run(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self.idle),
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "maxsize": self.maxsize,
+        }
+
+    async def _open(self) -> PooledConnection:
+        delay = self.connect_backoff
+        for attempt in range(1, self.connect_attempts + 1):
+            try:
+                connection = await self.run(self.connect)
+            except Exception as error:
+                log.error(
+                    "Нет соединения с базой (попытка %d/%d): %s",
+                    attempt,
+                    self.connect_attempts,
+                    error,
                 )
-                self.cursor = self.connection.cursor()
-                return
-            except psycopg2.DatabaseError as error:
-                print("Error:", error)
-                self.connection = None
-                self.cursor = None
-                time.sleep(2)
-
-    def close(self):
+                if attempt < self.connect_attempts:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                continue
+            self.size += 1
+            metrics.DB_POOL_CONNECTS.inc()
+            return PooledConnection(connection)
+        raise DatabaseUnavailable("Database is unavailable")
+
+    @staticmethod
+    def _ping(connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+
+    async def _healthy(self, pooled: PooledConnection) -> bool:
+        if pooled.connection.closed:
+            return False
+        if time.monotonic() - pooled.last_used < self.health_check_after:
+            return True
         try:
-            if self.cursor:
-                self.cursor.close()
-        except Exception:
-            pass
+            await self.run(self._ping, pooled.connection)
+            return True
+        except Exception as error:
+            log.warning("Соединение с базой не отвечает: %s", error)
+            metrics.DB_POOL_HEALTH_FAILURES.inc()
+            return False
+
+    def _discard(self, pooled: PooledConnection):
+        self.size -= 1
         try:
-            if self.connection:
-                self.connection.close()
+            pooled.connection.close()
         except Exception:
             pass
 
-    def get_database(self):
-        if not (self.connection and self.cursor):
-            self.connect()
-        if not (self.connection and self.cursor):
-            raise Exception("Failed to establish a database connection")
-        return (
-            self.connection,
-            self.cursor,
-            self.cursor.execute,
-        )
+    async def acquire(self) -> PooledConnection:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxsize)
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise DatabaseUnavailable("Database pool is exhausted")
+        finally:
+            self.waiting -= 1
+        try:
+            while self.idle:
+                pooled = self.idle.pop()
+                if await self._healthy(pooled):
+                    break
+                self._discard(pooled)
+            else:
+                pooled = await self._open()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.in_use += 1
+        metrics.DB_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+        return pooled
 
+    def release(self, pooled: PooledConnection):
+        self.in_use -= 1
+        if pooled.broken or pooled.connection.closed:
+            self._discard(pooled)
+        else:
+            pooled.last_used = time.monotonic()
+            self.idle.append(pooled)
+        self._semaphore.release()
 
-db_instance = Database()
+    @asynccontextmanager
+    async def connection(self):
+        pooled = await self.acquire()
+        try:
+            yield Db(self, pooled)
+        finally:
+            self.release(pooled)
 
+    async def close(self):
+        while self.idle:
+            self._discard(self.idle.pop())
+        self._executor.shutdown(wait=False)
 
-def get_db():
-    return db_instance.get_database()
 
+pool = ConnectionPool(
+    maxsize=int(os.getenv("DB_POOL_SIZE", "10")),
+    acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    # 0 — для пулеров в режиме транзакций, где PREPARE не переживает запрос
+    prepare=os.getenv("DB_PREPARE", "1") == "1",
+)
 
-def db_get_task_by_id(task_id: int, db_cursor):
-    query = "SELECT * FROM tasks WHERE task_id = %s;"
-    db_cursor.execute(query, (task_id,))
-    return db_cursor.fetchone()
 
+def _pool_connections():
+    return [(("idle",), len(pool.idle)), (("in_use",), pool.in_use)]
 
-def db_save(db_connection, db_cursor, query: str, values: tuple):
-    try:
-        db_cursor.execute(query, values)
-        db_connection.commit()
-        return db_cursor
-    except Exception:
-        try:
-            db_connection.rollback()
-        except Exception:
-            pass
-        raise
+
+metrics.DB_POOL_CONNECTIONS.set_function(_pool_connections)
+metrics.DB_POOL_WAITING.set_function(lambda: pool.waiting)
+
+
+def connection():
+    """Соединение из текущего пула (бенчмарки подменяют database.pool)."""
+    return pool.connection()
+
+
+async def get_db():
+    async with connection() as db:
+        yield db
+
+
+# ===== Частые запросы ===== #
+
+ROUTE_BY_ID = statement(
+    "route_by_id", "SELECT route_id, name, coordinates FROM routes WHERE route_id = %s;"
+)
+ALL_ROBOTS = statement("all_robots", "SELECT * FROM robots;")
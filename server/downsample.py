@@ -0,0 +1,87 @@
+# downsample.py
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _clean(x: np.ndarray, y: np.ndarray):
+    # Пропуски (NaN) на графике не рисуются и в прореживании не участвуют
+    valid = ~np.isnan(y)
+    if valid.all():
+        return x, y
+    return x[valid], y[valid]
+
+
+def minmax(x: np.ndarray, y: np.ndarray, points: int):
+    """
+    Минимум и максимум в каждой из points/2 корзин равной длины (по числу
+    точек). Сохраняет все пики — подходит для напряжения и нагрузки CPU.
+    """
+    x, y = _clean(x, y)
+    n = len(y)
+    buckets = max(1, points // 2)
+    if n <= points:
+        return x, y
+    size = -(-n // buckets)
+    pad = buckets * size - n
+    low = np.concatenate([y, np.full(pad, np.inf)]).reshape(buckets, size)
+    high = np.concatenate([y, np.full(pad, -np.inf)]).reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    picked = np.stack(
+        [offsets + low.argmin(axis=1), offsets + high.argmax(axis=1)], axis=1
+    )
+    # Внутри корзины сохраняем порядок по времени, пустых корзин нет
+    picked = np.unique(np.sort(picked, axis=1).ravel())
+    return x[picked], y[picked]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int):
+    """
+    Largest-Triangle-Three-Buckets: первая и последняя точки сохраняются,
+    из каждой промежуточной корзины берётся точка с наибольшей площадью
+    треугольника с выбранной точкой предыдущей корзины и средним следующей.
+    Площади внутри корзины считаются векторно, цикл — только по корзинам.
+    """
+    x, y = _clean(x, y)
+    n = len(y)
+    if points < 3 or n <= points:
+        return x, y
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # Средние по корзинам сразу для всех — через накопленные суммы
+    cx = np.concatenate([[0.0], np.cumsum(x)])
+    cy = np.concatenate([[0.0], np.cumsum(y)])
+    counts = np.diff(edges)
+    mean_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    mean_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+    # Последняя корзина «видит» последнюю точку ряда
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    picked = np.empty(points, dtype=np.int64)
+    picked[0] = 0
+    picked[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs(
+            (x[a] - mean_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (mean_y[i + 1] - y[a])
+        )
+        a = start + int(area.argmax())
+        picked[i + 1] = a
+    return x[picked], y[picked]
+
+
+def downsample(x: np.ndarray, y: np.ndarray, points: int, method: str = "lttb"):
+    if method == "minmax":
+        return minmax(x, y, points)
+    if method == "lttb":
+        return lttb(x, y, points)
+    raise ValueError(f"Unknown downsample method: {method}")
+
+
+def series(x: np.ndarray, y: np.ndarray, points: int, method: str = "lttb") -> dict:
+    xs, ys = downsample(
+        np.asarray(x, dtype=float), np.asarray(y, dtype=float), points, method
+    )
+    return {"ts": xs.tolist(), "value": ys.tolist()}
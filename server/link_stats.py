@@ -0,0 +1,132 @@
+# link_stats.py
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Точность гистограммы: 2^SUB_BITS корзин на первую октаву, дальше по
+# половине этого числа на каждую степень двойки — относительная ошибка < 1/64
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+
+
+def _index(value: int) -> int:
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return SUB_COUNT + (shift - 1) * HALF_COUNT + ((value >> shift) - HALF_COUNT)
+
+
+def _lower_bound(index: int) -> int:
+    if index < SUB_COUNT:
+        return index
+    shift = (index - SUB_COUNT) // HALF_COUNT + 1
+    return ((index - SUB_COUNT) % HALF_COUNT + HALF_COUNT) << shift
+
+
+class Histogram:
+    """
+    Гистограмма в духе HdrHistogram: целые значения (микросекунды) в
+    лог-линейных корзинах, массив счётчиков выделяется один раз под
+    max_value. Запись — O(1) без аллокаций, перцентиль — проход по массиву.
+    """
+
+    def __init__(self, max_value: int = 60_000_000):
+        self.max_value = max_value
+        self.counts: List[int] = [0] * (_index(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def record(self, value: int):
+        value = min(max(0, int(value)), self.max_value)
+        self.counts[_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        target = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                # Середина корзины, но не за пределами наблюдавшихся значений
+                low = _lower_bound(index)
+                high = _lower_bound(index + 1) - 1
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Сводка в миллисекундах."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "min": self.min / 1000,
+            "p50": self.percentile(0.50) / 1000,
+            "p90": self.percentile(0.90) / 1000,
+            "p99": self.percentile(0.99) / 1000,
+            "max": self.max / 1000,
+            "mean": self.total / self.count / 1000,
+        }
+
+
+class LinkStats:
+    """
+    Качество связи одного соединения по пингам сервера: RTT и смещение
+    часов клиента относительно сервера (по середине RTT, как в NTP).
+    Смещение бывает отрицательным — в гистограмму идёт модуль, знак
+    последнего измерения хранится отдельно.
+    """
+
+    # Пинги без ответа дольше этого числа новых пингов считаются потерянными
+    MAX_PENDING = 8
+
+    def __init__(self):
+        self.rtt = Histogram()
+        self.offset = Histogram()
+        self.last_rtt: Optional[float] = None
+        self.last_offset: Optional[float] = None
+        self.sent = 0
+        self.lost = 0
+        # id пинга -> (monotonic, время сервера) отправки
+        self.pending: Dict[int, Tuple[float, float]] = {}
+
+    def ping_sent(self, ping_id: int, server_time: float):
+        self.sent += 1
+        self.pending[ping_id] = (time.monotonic(), server_time)
+        while len(self.pending) > self.MAX_PENDING:
+            del self.pending[next(iter(self.pending))]
+            self.lost += 1
+
+    def pong_received(self, ping_id, client_time: Optional[float]) -> Optional[float]:
+        pending = self.pending.pop(ping_id, None)
+        if pending is None:
+            return None
+        sent_at, server_time = pending
+        rtt = time.monotonic() - sent_at
+        self.last_rtt = rtt
+        self.rtt.record(rtt * 1e6)
+        if client_time is not None:
+            offset = client_time - (server_time + rtt / 2)
+            self.last_offset = offset
+            self.offset.record(abs(offset) * 1e6)
+        return rtt
+
+    def summary(self) -> dict:
+        return {
+            "rtt_ms": self.rtt.summary(),
+            "clock_offset_ms": self.offset.summary(),
+            "last_rtt_ms": None if self.last_rtt is None else self.last_rtt * 1000,
+            "last_clock_offset_ms": (
+                None if self.last_offset is None else self.last_offset * 1000
+            ),
+            "pings_sent": self.sent,
+            "pings_lost": self.lost,
+        }
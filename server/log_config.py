@@ -0,0 +1,165 @@
+# log_config.py
+# Копия — robot/log_config.py (робот разворачивается отдельно);
+# правки вносить в обе копии
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+ROOT = "server"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Логгер категории: ws.recv, ws.send, ws.conn, relay, db, routes, ..."""
+    return logging.getLogger(f"{ROOT}.{category}")
+
+
+def _category(record: logging.LogRecord) -> str:
+    if record.name.startswith(ROOT + "."):
+        return record.name[len(ROOT) + 1 :]
+    return record.name
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    # "ws.recv=0.01,ws.send=0.1" -> {"ws.recv": 0.01, "ws.send": 0.1}
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        rates[name.strip()] = float(value)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей категории; WARNING и выше проходят всегда."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(_category(record))
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket на категорию; WARNING и выше проходят всегда и токенов
+    не тратят. Отброшенные записи считаются, и первая пропущенная после
+    паузы сообщает, сколько было подавлено.
+    """
+
+    def __init__(self, per_second: float, burst: Optional[float] = None):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst or per_second
+        self.buckets: Dict[str, list] = {}
+        self.suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.per_second <= 0 or record.levelno >= logging.WARNING:
+            return True
+        category = _category(record)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get(category)
+            if bucket is None:
+                bucket = self.buckets[category] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                self.suppressed[category] = self.suppressed.get(category, 0) + 1
+                return False
+            bucket[0] = tokens - 1
+            dropped = self.suppressed.pop(category, 0)
+        if dropped:
+            record.msg = f"{record.msg} [+{dropped} suppressed]"
+        return True
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладёт записи в очередь для фонового потока; длинные аргументы (payload
+    кадров) обрезаются до форматирования, чтобы не копировать мегабайты.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_length: int):
+        super().__init__(log_queue)
+        self.max_length = max_length
+
+    def _shorten(self, value):
+        if isinstance(value, bytes) and len(value) > self.max_length:
+            return f"{value[: self.max_length]!r}… ({len(value)} bytes)"
+        if isinstance(value, str) and len(value) > self.max_length:
+            return f"{value[: self.max_length]}… ({len(value)} chars)"
+        return value
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if self.max_length > 0:
+            if isinstance(record.args, tuple):
+                record.args = tuple(self._shorten(arg) for arg in record.args)
+            if isinstance(record.msg, str) and len(record.msg) > self.max_length:
+                record.msg = self._shorten(record.msg)
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Лучше потерять запись, чем остановить цикл событий
+            pass
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    sample: Optional[str] = None,
+    rate_limit: Optional[float] = None,
+    max_payload: Optional[int] = None,
+):
+    """
+    Настраивает логирование сервера через очередь и фоновый поток.
+    Параметры по умолчанию берутся из LOG_LEVEL, LOG_SAMPLE, LOG_RATE_LIMIT
+    и LOG_MAX_PAYLOAD. Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    sample = sample if sample is not None else os.getenv("LOG_SAMPLE", "")
+    if rate_limit is None:
+        rate_limit = float(os.getenv("LOG_RATE_LIMIT", "50"))
+    if max_payload is None:
+        max_payload = int(os.getenv("LOG_MAX_PAYLOAD", "200"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=10000)
+    handler = TruncatingQueueHandler(log_queue, max_payload)
+    handler.addFilter(SamplingFilter(_parse_rates(sample)))
+    handler.addFilter(RateLimitFilter(rate_limit))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(
+        logging.Formatter(
+            "[%(asctime)s] %(levelname)s %(name)s: %(message)s", datefmt="%H:%M:%S"
+        )
+    )
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(level.upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,9 +1,34 @@
+from contextlib import asynccontextmanager
+
+import database
 import session_management
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from routes import router
+from fastapi.responses import JSONResponse
+from log_config import setup_logging
+from routes import manager, progress_buffer, router
+
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    await progress_buffer.start()
+    yield
+    await progress_buffer.stop()
+    await manager.stop()
+    await database.pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# База недоступна или все соединения пула заняты дольше DB_POOL_TIMEOUT
+@app.exception_handler(database.DatabaseUnavailable)
+async def database_unavailable(request: Request, exc: database.DatabaseUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
-app = FastAPI()
 
 app.add_middleware(
     CORSMiddleware,
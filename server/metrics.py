@@ -0,0 +1,280 @@
+# metrics.py
+import bisect
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Счётчики меняются только из цикла событий (или под GIL одним байткодом
+# на значение), поэтому обходимся без блокировок. Дочерние метрики с метками
+# создаются один раз и кешируются вызывающим кодом — на горячем пути только +=.
+
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+_registry: List["Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            yield f"{self.name}{_format_labels(self.label_names, values)} {child.value}"
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя ячейка — +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, values, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_sum{labels} {child.sum}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Gauge(Metric):
+    """
+    Значение считается при сборе: функция возвращает число или, для метрики
+    с метками, пары (значения меток, число).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.function: Optional[Callable] = None
+
+    def set_function(self, function: Callable):
+        self.function = function
+
+    def set(self, value: float):
+        self.function = lambda: value
+
+    def samples(self):
+        if self.function is None:
+            return
+        try:
+            value = self.function()
+        except Exception:
+            return
+        if not self.label_names:
+            yield f"{self.name} {value}"
+            return
+        for values, sample in value:
+            yield f"{self.name}{_format_labels(self.label_names, values)} {sample}"
+
+
+_collectors: List[Callable[[], Awaitable[None]]] = []
+
+
+def add_collector(collector: Callable[[], Awaitable[None]]):
+    """Асинхронный сбор перед render() — для значений, которые читаются из базы."""
+    _collectors.append(collector)
+
+
+async def collect():
+    for collector in _collectors:
+        try:
+            await collector()
+        except Exception:
+            pass
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# ===== Метрики сервера ===== #
+
+ROLES = ("robot", "operator", "unknown")
+
+WS_MESSAGES_IN = Counter("ws_messages_in_total", "Кадры, принятые по /ws", ["role"])
+WS_MESSAGES_OUT = Counter(
+    "ws_messages_out_total", "Кадры, отправленные по /ws", ["role"]
+)
+WS_BYTES_IN = Counter("ws_bytes_in_total", "Байты, принятые по /ws", ["role"])
+WS_BYTES_OUT = Counter("ws_bytes_out_total", "Байты, отправленные по /ws", ["role"])
+WS_SEND_SECONDS = Histogram(
+    "ws_send_seconds", "Длительность send_text/send_bytes", ["role"]
+)
+WS_SEND_QUEUE_DEPTH = Gauge(
+    "ws_send_queue_depth", "Кадров в исходящей очереди соединения", ["role", "client"]
+)
+WS_SEND_DROPPED = Gauge(
+    "ws_send_dropped", "Кадров, отброшенных политикой переполнения", ["role", "client"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Время запросов к базе по обработчикам", ["handler"]
+)
+BCRYPT_SECONDS = Histogram(
+    "bcrypt_seconds",
+    "Время проверки пароля bcrypt в create_session",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+ACTIVE_SESSIONS = Gauge("active_sessions", "Активные сессии")
+
+# Метки известны заранее — дочерние метрики создаются при импорте
+for _role in ROLES:
+    for _metric in (WS_MESSAGES_IN, WS_MESSAGES_OUT, WS_BYTES_IN, WS_BYTES_OUT):
+        _metric.labels(_role)
+    WS_SEND_SECONDS.labels(_role)
+for _handler in (
+    "get_tasks",
+    "create_task",
+    "create_tasks_bulk",
+    "flush_task_progress",
+):
+    DB_QUERY_SECONDS.labels(_handler)
+BCRYPT_SECONDS.labels()
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Соединения пула базы по состоянию", ["state"]
+)
+DB_POOL_WAITING = Gauge("db_pool_waiting", "Запросы, ждущие соединения из пула")
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds", "Время получения соединения из пула"
+)
+DB_POOL_CONNECTS = Counter("db_pool_connects_total", "Открытые соединения с базой")
+DB_POOL_HEALTH_FAILURES = Counter(
+    "db_pool_health_failures_total", "Соединения, не прошедшие проверку SELECT 1"
+)
+DB_STATEMENTS_PREPARED = Counter(
+    "db_statements_prepared_total", "PREPARE частых запросов на соединениях пула"
+)
+ROUTE_CACHE_BYTES = Gauge("route_cache_bytes", "Размер маршрутов в кеше воркера")
+ROUTE_CACHE_ROUTES = Gauge("route_cache_routes", "Маршрутов в кеше воркера")
+DB_POOL_ACQUIRE_SECONDS.labels()
+DB_STATEMENTS_PREPARED.labels()
+DB_POOL_CONNECTS.labels()
+DB_POOL_HEALTH_FAILURES.labels()
@@ -0,0 +1,128 @@
+# outbound.py
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Union
+
+import metrics
+from fastapi import WebSocket
+from log_config import get_logger
+
+log = get_logger("ws.send")
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+
+class OutboundChannel:
+    """
+    Исходящая очередь одного соединения с собственной задачей-писателем.
+
+    Рассылка только кладёт сообщение в очередь и не ждёт сокет, поэтому
+    медленный клиент задерживает лишь себя. При переполнении очереди
+    срабатывает политика: drop_oldest, drop_newest или disconnect.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        maxsize: int = 256,
+        policy: str = DROP_OLDEST,
+        on_close: Optional[Callable[[WebSocket], None]] = None,
+        tap: Optional[Callable[[WebSocket, Union[str, bytes]], None]] = None,
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.websocket = websocket
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.on_close = on_close
+        # Наблюдатель за уходящими в сокет кадрами (запись трафика)
+        self.tap = tap
+        self.queue: Deque[Union[str, bytes]] = deque()
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.set_role("unknown")
+
+    def set_role(self, role: str):
+        self.role = role if role in metrics.ROLES else "unknown"
+        self._sent = metrics.WS_MESSAGES_OUT.labels(self.role)
+        self._sent_bytes = metrics.WS_BYTES_OUT.labels(self.role)
+        self._send_seconds = metrics.WS_SEND_SECONDS.labels(self.role)
+        # Входящие кадры считает менеджер, счётчики соединения живут здесь
+        self.received = metrics.WS_MESSAGES_IN.labels(self.role)
+        self.received_bytes = metrics.WS_BYTES_IN.labels(self.role)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    def put(self, message: Union[str, bytes]) -> bool:
+        """Неблокирующая постановка в очередь. False — сообщение не принято."""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return False
+            if self.policy == DISCONNECT:
+                self._shutdown(close_socket=True)
+                return False
+            self.queue.popleft()
+        self.queue.append(message)
+        self._ready.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                message = self.queue.popleft()
+                if self.tap is not None:
+                    self.tap(self.websocket, message)
+                started = time.perf_counter()
+                if isinstance(message, str):
+                    await self.websocket.send_text(message)
+                else:
+                    await self.websocket.send_bytes(message)
+                self._send_seconds.observe(time.perf_counter() - started)
+                self._sent.inc()
+                # JSON кодируется с ensure_ascii, так что длина строки = байты
+                self._sent_bytes.inc(len(message))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            log.warning("Ошибка отправки %s: %s", self.websocket.client, e)
+            self._shutdown(close_socket=False)
+
+    def _shutdown(self, close_socket: bool):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._ready.set()
+        if self.on_close is not None:
+            self.on_close(self.websocket)
+        if close_socket:
+            asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1008)
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self._ready.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
@@ -0,0 +1,70 @@
+# polyline.py
+import json
+from typing import Iterable, List, Union
+
+# Формат polyline6: алгоритм Google Encoded Polyline с точностью 1e-6
+# (около 0,1 м). Каждая точка — разности lat/lng с предыдущей, zigzag и
+# 5-битные группы в символах ASCII 63..126: 4–8 байт на точку маршрута
+# вместо ~40 у JSON {"lat": ..., "lng": ...}
+FORMAT = "polyline6"
+FACTOR = 10**6
+
+
+def _encode_value(value: int, out: List[str]):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode(points: Iterable[dict]) -> str:
+    out: List[str] = []
+    prev_lat = prev_lng = 0
+    for point in points:
+        lat = round(float(point["lat"]) * FACTOR)
+        lng = round(float(point["lng"]) * FACTOR)
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lng - prev_lng, out)
+        prev_lat, prev_lng = lat, lng
+    return "".join(out)
+
+
+def decode(text: str) -> List[dict]:
+    """
+    Точки {"lat", "lng"}. Раскодированные маршруты хранит RouteCache
+    в пределах своего бюджета байт.
+    """
+    points = []
+    index = lat = lng = 0
+    length = len(text)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(text[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append({"lat": lat / FACTOR, "lng": lng / FACTOR})
+    return points
+
+
+def to_polyline(coordinates: Union[str, list, None]) -> str:
+    """
+    Значение колонки routes.coordinates — в polyline6. Новые маршруты
+    хранятся строкой polyline, старые — массивом точек (или его JSON-текстом).
+    """
+    if coordinates is None:
+        return ""
+    if isinstance(coordinates, str):
+        if not coordinates.startswith("["):
+            return coordinates
+        coordinates = json.loads(coordinates)
+    return encode(coordinates)
@@ -0,0 +1,134 @@
+# progress_buffer.py
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import database
+import metrics
+from log_config import get_logger
+
+log = get_logger("progress")
+
+
+class ProgressBuffer:
+    """
+    Отложенная запись прогресса задач. update() только запоминает значение
+    в словаре — последняя запись по task_id побеждает, промежуточные до базы
+    не доходят. Раз в flush_interval накопленное уходит одним
+    UPDATE ... FROM (VALUES ...) на batch_size строк.
+
+    Пока значение не записано, его отдаёт get()/merge(), так что чтение
+    задач видит свежий прогресс. Неудачный сброс возвращает значения в
+    буфер, если за это время не пришли более новые.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        batch_size: int = 1000,
+        on_flush: Optional[Callable[[], None]] = None,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Вызывается после записи — например, чтобы сменить версию списка задач
+        self.on_flush = on_flush
+        self.pending: Dict[int, float] = {}
+        # Значения сброса, который идёт сейчас: тоже видны чтению
+        self.flushing: Dict[int, float] = {}
+        self.updates = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    def update(self, task_id: int, progress: float):
+        if task_id in self.pending:
+            self.coalesced += 1
+        self.pending[task_id] = progress
+        self.updates += 1
+
+    def get(self, task_id: int) -> Optional[float]:
+        progress = self.pending.get(task_id)
+        if progress is None:
+            progress = self.flushing.get(task_id)
+        return progress
+
+    def merge(self, tasks: Iterable[dict]):
+        """Подставляет в строки задач ещё не записанный прогресс."""
+        if not (self.pending or self.flushing):
+            return
+        for task in tasks:
+            progress = self.get(task["task_id"])
+            if progress is not None:
+                task["progress"] = progress
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "updates": self.updates,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+    async def start(self):
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+
+    async def _run_timer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    @staticmethod
+    def _query(count: int) -> str:
+        values = ", ".join(["(%s, %s)"] * count)
+        return f"""
+        WITH v (task_id, progress) AS (VALUES {values})
+        UPDATE tasks SET progress = v.progress
+        FROM v
+        WHERE tasks.task_id = v.task_id;
+        """
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            self.flushing, self.pending = self.pending, {}
+            items = list(self.flushing.items())
+            started = time.perf_counter()
+            try:
+                with metrics.DB_QUERY_SECONDS.labels("flush_task_progress").time():
+                    async with database.connection() as db:
+                        for i in range(0, len(items), self.batch_size):
+                            batch = items[i : i + self.batch_size]
+                            params = [value for item in batch for value in item]
+                            await db.execute(self._query(len(batch)), params)
+            except Exception as e:
+                self.failed_flushes += 1
+                for task_id, progress in self.flushing.items():
+                    self.pending.setdefault(task_id, progress)
+                log.error("Ошибка записи прогресса (%d задач): %s", len(items), e)
+                return
+            finally:
+                self.flushing = {}
+            self.flushes += 1
+            self.written += len(items)
+            self.last_flush_seconds = time.perf_counter() - started
+        if self.on_flush is not None:
+            self.on_flush()
@@ -0,0 +1,107 @@
+# route_cache.py
+import json
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import polyline
+
+
+class RouteCache:
+    """
+    Маршруты по route_id в памяти воркера, вытеснение LRU по суммарному
+    размеру. Размер маршрута — длина его JSON: координаты занимают почти
+    всё место, и точнее считать незачем. Раскодированные точки хранятся
+    в той же записи и входят в её размер.
+
+    complete означает, что в кеше лежат все маршруты базы, и список можно
+    отдать без запроса. Признак снимается при вытеснении и при изменении
+    маршрута на другом воркере — следующий список читается из базы.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.routes: "OrderedDict[int, dict]" = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.complete = False
+        # Растёт при каждой инвалидации: список, прочитанный до неё, устарел
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.routes)
+
+    def get(self, route_id: int) -> Optional[dict]:
+        route = self.routes.get(route_id)
+        if route is None:
+            self.misses += 1
+            return None
+        self.routes.move_to_end(route_id)
+        self.hits += 1
+        return route
+
+    def put(self, route: dict) -> bool:
+        route_id = route["route_id"]
+        size = len(json.dumps(route, default=str))
+        self._remove(route_id)
+        if size > self.max_bytes:
+            self.complete = False
+            return False
+        while self.routes and self.bytes + size > self.max_bytes:
+            self._remove(next(iter(self.routes)))
+            self.complete = False
+        self.routes[route_id] = route
+        self.sizes[route_id] = size
+        self.bytes += size
+        return True
+
+    def fill(self, routes: Iterable[dict], generation: int):
+        """
+        Полный список маршрутов из базы, прочитанный при данном generation;
+        не поместился — complete снимет put.
+        """
+        self.complete = generation == self.generation
+        for route in routes:
+            self.put(route)
+
+    def coordinates(self, route_id: int, encoded: str) -> Tuple[dict, ...]:
+        """
+        Точки маршрута из его polyline6. Раскодированный вид сохраняется,
+        только если маршрут с этой же строкой лежит в кеше; иначе точки
+        раскодируются заново. Кортеж общий для всех вызывающих — не изменять.
+        """
+        route = self.routes.get(route_id)
+        if route is None or route["polyline"] != encoded:
+            return tuple(polyline.decode(encoded))
+        points = route.get("coordinates")
+        if points is None:
+            points = tuple(polyline.decode(encoded))
+            if not self.put({**route, "coordinates": points}):
+                # Вместе с точками не помещается — остаётся одна строка
+                self.put(route)
+        return points
+
+    def invalidate(self, route_id: int):
+        self._remove(route_id)
+        self.complete = False
+        self.generation += 1
+
+    def all(self) -> Optional[List[dict]]:
+        if not self.complete:
+            return None
+        return [self.routes[route_id] for route_id in sorted(self.routes)]
+
+    def _remove(self, route_id: int):
+        if self.routes.pop(route_id, None) is not None:
+            self.bytes -= self.sizes.pop(route_id)
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self.routes),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "complete": self.complete,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -1,151 +1,157 @@
 # routes.py
 import json
-import time
-from datetime import datetime
-from typing import Dict, List
-
-from database import get_db
+import os
+from typing import List, Optional
+
+import codec
+import metrics
+import numpy as np
+import polyline
+import psycopg2.extensions
+from backplane import create_backplane
+from codec import Payload
+from collection_versions import CollectionVersions
+from connection_manager import ConnectionManager
+from database import (
+    ALL_ROBOTS,
+    ROUTE_BY_ID,
+    DatabaseUnavailable,
+    connection,
+    connection_params,
+    get_db,
+)
+from downsample import METHODS, series
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Request,
+    Response,
     WebSocket,
     WebSocketDisconnect,
 )
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from log_config import get_logger
 from psycopg2.extras import RealDictCursor
+from progress_buffer import ProgressBuffer
 from pydantic import BaseModel
+from route_cache import RouteCache
+from telemetry_history import FIELDS, TelemetryHistory, to_columns
+from telemetry_store import ROLLUP_FIELDS, TelemetryWriter
+from wire_recorder import WireRecorder
 
 router = APIRouter()
+log = get_logger("routes")
+recv_log = get_logger("ws.recv")
 
 
 # login test
 @router.get("/login")
 async def read_users(db=Depends(get_db)):
-    _, cursor, execute = db
-    execute("SELECT * FROM users")
-    users = cursor.fetchall()
+    users = await db.fetchall("SELECT * FROM users")
     return {"users": users}
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.robots: List[WebSocket] = []
-        self.operators: List[WebSocket] = []
-        self.robot_statuses: Dict[str, str] = {}
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        print(
-            f"[{datetime.now().strftime('%H:%M:%S')}] Новое подключение: {websocket.client}"
-        )
-
-    async def send_status_summary(self):
-        status_summary = {
-            "type": "robot_status_summary",
-            "statuses": self.calculate_status_summary(),
-            "connected_robots": len(self.robots),
-        }
-        await self.send_to_operators(json.dumps(status_summary))
-
-    def calculate_status_summary(self):
-        summary = {}
-        for status in self.robot_statuses.values():
-            summary[status] = summary.get(status, 0) + 1
-        return summary
-
-    def register(self, websocket: WebSocket, role: str):
-        if role == "robot":
-            self.robots.append(websocket)
-            self.robot_statuses[str(id(websocket))] = "unknown"
-            print(
-                f"[{datetime.now().strftime('%H:%M:%S')}] New ROB: {len(self.robots)}"
-            )
-        elif role == "operator":
-            self.operators.append(websocket)
-            print(
-                f"[{datetime.now().strftime('%H:%M:%S')}] New OP: {len(self.operators)}"
-            )
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.robots:
-            self.robots.remove(websocket)
-            ws_id = str(id(websocket))
-            if ws_id in self.robot_statuses:
-                del self.robot_statuses[ws_id]
-        if websocket in self.operators:
-            self.operators.remove(websocket)
-
-    async def send_to_operators(self, message: str):
-        if not self.operators:
-            print("⚠️ No OPs")
-            return
-
-        print(
-            f"[{datetime.now().strftime('%H:%M:%S')}] Отправка операторам ({len(self.operators)} шт): {message}"
-        )
-        for conn in self.operators:
-            try:
-                await conn.send_text(message)
-            except Exception as e:
-                print(
-                    f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Ошибка отправки оператору: {e}"
-                )
-                self.operators.remove(conn)
-
-    async def send_to_robots(self, message: str):
-        if not self.robots:
-            return
-
-        print(f"📤 Отправка роботам ({len(self.robots)} шт): {message}")
-        for conn in self.robots:
-            try:
-                await conn.send_text(message)
-            except Exception as e:
-                print(
-                    f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Ошибка отправки роботу: {e}"
-                )
-                self.robots.remove(conn)
-
-    async def handle_ping(self, websocket: WebSocket, data: dict):
-        if data.get("type") == "ping":
-            response = {
-                "type": "pong",
-                "timestamp": data["timestamp"],
-                "server_time": time.time(),
-            }
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Ping -pong")
-            await websocket.send_text(json.dumps(response))
+telemetry_writer = (
+    TelemetryWriter(
+        connection_params(),
+        batch_size=int(os.getenv("TELEMETRY_FLUSH_ROWS", "5000")),
+        flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1")),
+        max_buffer=int(os.getenv("TELEMETRY_BUFFER_MAX", "100000")),
+    )
+    if os.getenv("TELEMETRY_PERSIST", "1") == "1"
+    else None
+)
 
+# Память истории: TELEMETRY_RING_SIZE строк по 48 байт на каждого из
+# не более чем TELEMETRY_RING_ROBOTS роботов
+telemetry_history = TelemetryHistory(
+    capacity=int(os.getenv("TELEMETRY_RING_SIZE", "3600")),
+    max_robots=int(os.getenv("TELEMETRY_RING_ROBOTS", "1000")),
+)
 
-manager = ConnectionManager()
+# Ограничение размера ответа графиков и порог перехода на минутные агрегаты
+TELEMETRY_MAX_POINTS = int(os.getenv("TELEMETRY_MAX_POINTS", "5000"))
+TELEMETRY_ROLLUP_AFTER = float(os.getenv("TELEMETRY_ROLLUP_AFTER", "21600"))
+
+# Размер страницы GET /tasks/ по умолчанию и предельный; строк на пачку выгрузки
+TASKS_PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", "500"))
+TASKS_PAGE_MAX = int(os.getenv("TASKS_PAGE_MAX", "5000"))
+TASKS_EXPORT_BATCH = int(os.getenv("TASKS_EXPORT_BATCH", "1000"))
+# Предельное число задач в одном POST /tasks/bulk
+TASKS_BULK_MAX = int(os.getenv("TASKS_BULK_MAX", "1000"))
+
+# Метки версий списков для ETag: неизменившийся список — 304 без запроса к базе
+versions = CollectionVersions(["robots", "routes", "tasks"])
+
+# Маршруты в памяти воркера: create_task и списки не ходят за ними в базу
+route_cache = RouteCache(max_bytes=int(os.getenv("ROUTE_CACHE_BYTES", str(64 * 2**20))))
+
+manager = ConnectionManager(
+    queue_size=int(os.getenv("WS_SEND_QUEUE_SIZE", "256")),
+    overflow_policy=os.getenv("WS_OVERFLOW_POLICY", "drop_oldest"),
+    fleet_push_hz=float(os.getenv("WS_FLEET_PUSH_HZ", "5")),
+    status_debounce=float(os.getenv("WS_STATUS_DEBOUNCE", "0")),
+    # none — один воркер; postgres — несколько воркеров через LISTEN/NOTIFY
+    backplane=create_backplane(os.getenv("WS_BACKPLANE", "none"), connection_params()),
+    telemetry_writer=telemetry_writer,
+    history=telemetry_history,
+    # Путь к файлу записи трафика; воспроизведение — benchmarks/wire_replay.py
+    recorder=WireRecorder(os.getenv("WS_RECORD")) if os.getenv("WS_RECORD") else None,
+    # Период пингов сервера для замера RTT; 0 — не пинговать
+    ping_interval=float(os.getenv("WS_PING_INTERVAL", "5")),
+    # Соединение без входящих кадров дольше таймаута считается оборванным
+    robot_idle_timeout=float(os.getenv("WS_ROBOT_IDLE_TIMEOUT", "15")),
+    operator_idle_timeout=float(os.getenv("WS_OPERATOR_IDLE_TIMEOUT", "90")),
+    reaper_tick=float(os.getenv("WS_REAPER_TICK", "1")),
+    route_cache=route_cache,
+    versions=versions,
+)
+# Прогресс задач копится в памяти и пишется в базу раз в TASK_PROGRESS_FLUSH_INTERVAL;
+# после записи версия списка задач меняется и на остальных воркерах
+progress_buffer = ProgressBuffer(
+    flush_interval=float(os.getenv("TASK_PROGRESS_FLUSH_INTERVAL", "1")),
+    on_flush=lambda: manager.collection_changed("tasks"),
+)
+metrics.WS_SEND_QUEUE_DEPTH.set_function(manager.queue_depths)
+metrics.WS_SEND_DROPPED.set_function(manager.queue_drops)
+metrics.ROUTE_CACHE_BYTES.set_function(lambda: route_cache.bytes)
+metrics.ROUTE_CACHE_ROUTES.set_function(lambda: len(route_cache))
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    subprotocol = codec.negotiate(websocket.scope.get("subprotocols", []))
+    await manager.connect(websocket, subprotocol)
 
     try:
-        data = await websocket.receive_text()
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Первое сообщение: {data}")
+        data = await codec.receive_frame(websocket)
+        manager.record_inbound(websocket, data)
+        log.info("Первое сообщение: %s", data)
 
-        init_data = json.loads(data)
+        init_data = codec.decode(data)
         role = init_data.get("role")
-        manager.register(websocket, role)
+        manager.register(
+            websocket,
+            role,
+            robot_id=init_data.get("robot_id"),
+            geometry=init_data.get("geometry"),
+        )
 
         if role == "robot":
             response = {"status": "connected"}
-            await websocket.send_text(json.dumps(response))
-            await manager.send_status_summary()
+            manager.send(websocket, response)
 
         while True:
-            data = await websocket.receive_text()
-            print(
-                f"[{datetime.now().strftime('%H:%M:%S')}] Получено сообщение от {role}: {data}"
-            )
+            data = await codec.receive_frame(websocket)
+            manager.record_inbound(websocket, data)
+            recv_log.debug("Получено сообщение от %s: %s", role, data)
 
             try:
-                message = json.loads(data)
-            except json.JSONDecodeError:
+                message = codec.decode(data)
+            except codec.DecodeError:
+                manager.disconnect(websocket)
                 await websocket.close(code=1003)
                 return
 
@@ -154,54 +160,142 @@ async def websocket_endpoint(websocket: WebSocket):
                 continue
 
             if role == "robot":
+                if message.get("type") in ["telemetry_key", "telemetry_delta"]:
+                    if not manager.apply_telemetry_frame(websocket, message):
+                        manager.request_keyframe(websocket)
+                    continue
+
                 if "status" in message:
-                    ws_id = str(id(websocket))
-                    manager.robot_statuses[ws_id] = message["status"]
-                    print(f"🔄 Статус робота обновлен: {message['status']}")
-                    await manager.send_status_summary()
+                    manager.update_status(websocket, message["status"])
 
-                print("🔄 Перенаправляю данные от робота операторам")
-                await manager.send_to_operators(data)
+                if message.get("type") == "progress":
+                    _buffer_progress(message)
+
+                if "type" in message:
+                    # События (прогресс задачи и т.п.) уходят операторам сразу;
+                    # исходный кадр пересылается без перекодирования тем,
+                    # у кого тот же формат
+                    await manager.send_to_subscribers(websocket, Payload(message, data))
+                else:
+                    # Телеметрия попадает в кадр парка на ближайшем тике
+                    manager.update_telemetry(websocket, message)
 
             if role == "operator":
-                print("🔄 Перенаправляю данные от оператора роботам")
-                await manager.send_to_robots(data)
+                if message.get("type") in ["subscribe", "unsubscribe"]:
+                    manager.handle_subscription(websocket, message)
+                    continue
+
+                await manager.send_to_robots(Payload(message, data))
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
-        print({e})
+        log.exception("Ошибка WebSocket: %s", e)
+        manager.disconnect(websocket)
         await websocket.close(code=1011)
 
 
 @router.post("/routes/")
 async def create_route(route: dict, db=Depends(get_db)):
-    db_connection, db_cursor, _ = db
     try:
-        print(f"Полученные данные для маршрута: {route}")
+        log.info(
+            "Создание маршрута %s (%d точек)",
+            route.get("name"),
+            len(route.get("coordinates") or []),
+        )
         query = """
         INSERT INTO routes (name, coordinates, creation_date)
         VALUES (%s, %s, NOW())
         RETURNING route_id;
         """
-        db_cursor.execute(query, (route["name"], json.dumps(route["coordinates"])))
-        db_connection.commit()
-        route_id = db_cursor.fetchone()["route_id"]
+        # Маршрут хранится строкой polyline6 в той же JSON-колонке
+        encoded = polyline.to_polyline(route["coordinates"])
+        row = await db.fetchone(query, (route["name"], json.dumps(encoded)))
+        route_id = row["route_id"]
+        route_cache.put(
+            {"route_id": route_id, "name": route["name"], "polyline": encoded}
+        )
+        manager.route_changed(route_id)
+        manager.collection_changed("routes")
         return {"route_id": route_id}
+    except (HTTPException, DatabaseUnavailable):
+        raise
     except Exception as e:
-        db_connection.rollback()
-        print(f"Error creating route: {e}")
+        log.error("Error creating route: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create route")
 
 
+def _not_modified(request: Request, response: Response, collection: str):
+    """
+    304, если у клиента актуальная версия списка. Метка берётся до чтения
+    из базы: изменение во время чтения даст клиенту старую метку, и
+    следующий запрос прочитает список заново.
+    """
+    headers = {"ETag": versions.etag(collection), "Cache-Control": "no-cache"}
+    if versions.matches(collection, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+GEOMETRY_FORMATS = ("json", polyline.FORMAT)
+
+
+def _geometry_format(geometry: str) -> str:
+    if geometry not in GEOMETRY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown geometry: {geometry}")
+    return geometry
+
+
+def _route_row(row: dict) -> dict:
+    """Строка routes из базы — в вид кеша: геометрия всегда polyline6."""
+    return {
+        "route_id": row["route_id"],
+        "name": row["name"],
+        "polyline": polyline.to_polyline(row["coordinates"]),
+    }
+
+
+def _geometry(route_id: int, encoded: str, geometry: str) -> dict:
+    """
+    Геометрия для ответа: json — массив точек, как раньше (раскодированные
+    точки берутся из кеша маршрутов), polyline6 — строка как есть.
+    """
+    if geometry == polyline.FORMAT:
+        return {"polyline": encoded}
+    return {"coordinates": route_cache.coordinates(route_id, encoded)}
+
+
+# ?geometry=polyline6 — маршруты строками polyline6 вместо массивов точек
 @router.get("/routes/")
-async def get_routes(db=Depends(get_db)):
-    db_cursor, _ = db
+async def get_routes(request: Request, response: Response, geometry: str = "json"):
+    geometry = _geometry_format(geometry)
+    not_modified = _not_modified(request, response, "routes")
+    if not_modified is not None:
+        return not_modified
+    routes = route_cache.all()
+    if routes is None:
+        generation = route_cache.generation
+        try:
+            query = "SELECT route_id, name, coordinates FROM routes ORDER BY route_id;"
+            async with connection() as db:
+                routes = [_route_row(row) for row in await db.fetchall(query)]
+            route_cache.fill(routes, generation)
+        except (HTTPException, DatabaseUnavailable):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
     try:
-        query = "SELECT route_id, name, coordinates FROM routes;"
-        db_cursor.execute(query)
-        routes = db_cursor.fetchall()
-        return {"routes": routes}
+        return {
+            "routes": [
+                {
+                    "route_id": route["route_id"],
+                    "name": route["name"],
+                    **_geometry(route["route_id"], route["polyline"], geometry),
+                }
+                for route in routes
+            ]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -209,84 +303,299 @@ async def get_routes(db=Depends(get_db)):
 # Маршрут для создания задачи
 @router.post("/tasks/")
 async def create_task(task: dict, db=Depends(get_db)):
-    db_connection, db_cursor, _ = db
     try:
         query = """
         INSERT INTO tasks (route_id, robot_id, start_time, end_time, description)
         VALUES (%s, %s, %s, %s, %s)
         RETURNING task_id;
         """
-        db_cursor.execute(
-            query,
-            (
-                task["route_id"],
-                task["robot_id"],
-                task["start_time"],
-                task.get("end_time"),
-                task["description"],
-            ),
-        )
-        db_connection.commit()
-        task_id = db_cursor.fetchone()["task_id"]
+        with metrics.DB_QUERY_SECONDS.labels("create_task").time():
+            row = await db.fetchone(
+                query,
+                (
+                    task["route_id"],
+                    task["robot_id"],
+                    task["start_time"],
+                    task.get("end_time"),
+                    task["description"],
+                ),
+            )
+            task_id = row["task_id"]
 
-        # Получение координат маршрута по route_id
-        route_query = "SELECT coordinates FROM routes WHERE route_id = %s;"
-        db_cursor.execute(route_query, (task["route_id"],))
-        route_data = db_cursor.fetchone()
+            # Получение координат маршрута по route_id
+            route_data = await get_route(db, task["route_id"])
 
-        if not route_data or "coordinates" not in route_data:
+        if not route_data:
             raise ValueError(
                 f"Маршрут с ID {task['route_id']} не найден или не содержит координат."
             )
 
-        route_coordinates = route_data["coordinates"]
-
         message = {
             "type": "new_task",
             "task_id": task_id,
             "route_id": task["route_id"],
-            "route": route_coordinates,
+            # Роботам без поддержки polyline6 менеджер раскодирует в "route"
+            "polyline": route_data["polyline"],
             "robot_id": task["robot_id"],
             "start_time": task["start_time"],
             "description": task["description"],
         }
 
-        await manager.send_to_robots(json.dumps(message))
+        manager.collection_changed("tasks")
+        dispatched = await manager.send_to_robot(task["robot_id"], message)
+
+        return {"status": "success", "task_id": task_id, "dispatched": dispatched}
+    except (HTTPException, DatabaseUnavailable):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_route(db, route_id: int) -> Optional[dict]:
+    route = route_cache.get(route_id)
+    if route is None:
+        row = await db.fetchone(ROUTE_BY_ID, (route_id,))
+        if row is not None:
+            route = _route_row(row)
+            route_cache.put(route)
+    return route
+
+
+async def get_routes_by_id(db, route_ids) -> dict:
+    """Маршруты по route_id из кеша; промахи — одним запросом."""
+    routes = {}
+    for route_id in set(route_ids):
+        route = route_cache.get(route_id)
+        if route is not None:
+            routes[route_id] = route
+    missing = set(route_ids) - routes.keys()
+    if missing:
+        placeholders = ", ".join(["%s"] * len(missing))
+        rows = await db.fetchall(
+            "SELECT route_id, name, coordinates FROM routes "
+            f"WHERE route_id IN ({placeholders});",
+            tuple(missing),
+        )
+        for row in rows:
+            route = routes[row["route_id"]] = _route_row(row)
+            route_cache.put(route)
+    return routes
+
+
+async def _attach_coordinates(db, tasks: list, geometry: str):
+    routes = await get_routes_by_id(db, [task["route_id"] for task in tasks])
+    for task in tasks:
+        route = routes.get(task["route_id"])
+        if route is not None:
+            task.update(_geometry(route["route_id"], route["polyline"], geometry))
+        else:
+            task["coordinates"] = None
+
+
+class TaskFilters(BaseModel):
+    robot_id: Optional[int] = None
+    # Диапазон start_time
+    start_from: Optional[str] = None
+    start_to: Optional[str] = None
+    progress_min: Optional[float] = None
+    progress_max: Optional[float] = None
+    # false — без координат маршрута, самой тяжёлой части ответа
+    coordinates: bool = True
+    # json — массив точек; polyline6 — строка в 5–10 раз короче
+    geometry: str = "json"
+
+
+def _tasks_query(
+    filters: TaskFilters,
+    coordinates: bool,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+):
+    columns = (
+        "t.task_id, t.route_id, t.robot_id, t.start_time, t.end_time, "
+        "t.description, t.progress, r.name AS route_name"
+    )
+    if coordinates:
+        columns += ", r.coordinates"
+    conditions, params = [], []
+    for condition, value in (
+        ("t.task_id > %s", after),
+        ("t.robot_id = %s", filters.robot_id),
+        ("t.start_time >= %s", filters.start_from),
+        ("t.start_time < %s", filters.start_to),
+        ("t.progress >= %s", filters.progress_min),
+        ("t.progress <= %s", filters.progress_max),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT {columns}
+    FROM tasks t
+    JOIN routes r ON t.route_id = r.route_id
+    {where}
+    ORDER BY t.task_id
+    """
+    if limit is not None:
+        query += "LIMIT %s"
+        params.append(limit)
+    return query, params
+
+
+class BulkTask(BaseModel):
+    route_id: int
+    robot_id: int
+    start_time: str
+    end_time: Optional[str] = None
+    description: str = ""
+
+
+class BulkTasks(BaseModel):
+    tasks: List[BulkTask]
+
+
+# Пакет задач: одна вставка всех строк (один оператор — одна транзакция)
+# и одно сообщение new_tasks на робота с маршрутами без повторов
+@router.post("/tasks/bulk")
+async def create_tasks_bulk(data: BulkTasks, db=Depends(get_db)):
+    if not data.tasks:
+        return {"status": "success", "task_ids": [], "dispatched": {}}
+    if len(data.tasks) > TASKS_BULK_MAX:
+        raise HTTPException(
+            status_code=413, detail=f"At most {TASKS_BULK_MAX} tasks per request"
+        )
+    try:
+        routes = await get_routes_by_id(db, [task.route_id for task in data.tasks])
+        missing = sorted({t.route_id for t in data.tasks} - routes.keys())
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Unknown routes: {missing}")
+
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(data.tasks))
+        params = [
+            value
+            for task in data.tasks
+            for value in (
+                task.route_id,
+                task.robot_id,
+                task.start_time,
+                task.end_time,
+                task.description,
+            )
+        ]
+        with metrics.DB_QUERY_SECONDS.labels("create_tasks_bulk").time():
+            # task_id выдаются последовательностью в порядке строк VALUES
+            rows = await db.fetchall(
+                "INSERT INTO tasks "
+                "(route_id, robot_id, start_time, end_time, description) "
+                f"VALUES {values} RETURNING task_id;",
+                params,
+            )
+        task_ids = sorted(row["task_id"] for row in rows)
+        manager.collection_changed("tasks")
+
+        by_robot = {}
+        for task_id, task in zip(task_ids, data.tasks):
+            by_robot.setdefault(task.robot_id, []).append(
+                {
+                    "task_id": task_id,
+                    "route_id": task.route_id,
+                    "start_time": task.start_time,
+                    "description": task.description,
+                }
+            )
+        dispatched = {}
+        for robot_id, tasks in by_robot.items():
+            route_ids = {task["route_id"] for task in tasks}
+            message = {
+                "type": "new_tasks",
+                "robot_id": robot_id,
+                "tasks": tasks,
+                # Ключи — строки, как после JSON; роботам без поддержки
+                # polyline6 менеджер раскодирует их в "routes"
+                "polylines": {
+                    str(route_id): routes[route_id]["polyline"]
+                    for route_id in route_ids
+                },
+            }
+            dispatched[robot_id] = await manager.send_to_robot(robot_id, message)
 
-        return {"status": "success", "task_id": task_id}
+        return {"status": "success", "task_ids": task_ids, "dispatched": dispatched}
+    except (HTTPException, DatabaseUnavailable):
+        raise
     except Exception as e:
-        db_connection.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Маршрут для получения всех задач
+# Задачи страницами по task_id: следующая страница — ?after=next_after
 @router.get("/tasks/")
-async def get_tasks(db=Depends(get_db)):
-    db_cursor, _ = db
+async def get_tasks(
+    request: Request,
+    response: Response,
+    after: Optional[int] = None,
+    limit: int = TASKS_PAGE_SIZE,
+    filters: TaskFilters = Depends(),
+):
+    geometry = _geometry_format(filters.geometry)
+    not_modified = _not_modified(request, response, "tasks")
+    if not_modified is not None:
+        return not_modified
+    limit = max(1, min(limit, TASKS_PAGE_MAX))
     try:
-        query = """
-        SELECT t.task_id, t.route_id, t.robot_id, t.start_time, t.end_time, t.description, t.progress,
-            r.name AS route_name, r.coordinates
-        FROM tasks t
-        JOIN routes r ON t.route_id = r.route_id;
-        """
-        db_cursor.execute(query)
-        tasks = db_cursor.fetchall()
-        return {"tasks": tasks}
+        # Координаты подставляются из кеша маршрутов, а не тянутся джойном
+        query, params = _tasks_query(filters, False, after, limit)
+        with metrics.DB_QUERY_SECONDS.labels("get_tasks").time():
+            async with connection() as db:
+                tasks = await db.fetchall(query, params)
+                if filters.coordinates:
+                    await _attach_coordinates(db, tasks, geometry)
+        progress_buffer.merge(tasks)
+        next_after = tasks[-1]["task_id"] if len(tasks) == limit else None
+        return {"tasks": tasks, "next_after": next_after}
+    except (HTTPException, DatabaseUnavailable):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Выгрузка всех задач по фильтрам одним потоковым JSON — память сервера
+# не зависит от размера таблицы
+@router.get("/tasks/export")
+async def export_tasks(filters: TaskFilters = Depends()):
+    geometry = _geometry_format(filters.geometry)
+    query, params = _tasks_query(filters, filters.coordinates)
+
+    def convert(row: dict):
+        if "coordinates" in row:
+            encoded = polyline.to_polyline(row.pop("coordinates"))
+            row.update(_geometry(row["route_id"], encoded, geometry))
+
+    async def body():
+        # Соединение берётся на всё время передачи, а не на время обработчика
+        async with connection() as db:
+            yield b'{"tasks":['
+            first = True
+            async for rows in db.stream(query, params, TASKS_EXPORT_BATCH):
+                progress_buffer.merge(rows)
+                for row in rows:
+                    convert(row)
+                chunk = ",".join(json.dumps(row) for row in jsonable_encoder(rows))
+                yield (chunk if first else "," + chunk).encode()
+                first = False
+            yield b"]}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
 @router.post("/robots/")
 async def create_robot(robot: dict, db=Depends(get_db)):
-    db_connection, db_cursor, _ = db
     try:
         query = """
         INSERT INTO robots (name, commissioning_date, last_maintenance_date, service_life)
         VALUES (%s, %s, %s, %s)
         RETURNING robot_id;
         """
-        db_cursor.execute(
+        row = await db.fetchone(
             query,
             (
                 robot["name"],
@@ -295,19 +604,21 @@ async def create_robot(robot: dict, db=Depends(get_db)):
                 robot["service_life"],
             ),
         )
-        db_connection.commit()
-        robot_id = db_cursor.fetchone()["robot_id"]
-        return {"robot_id": robot_id}
+        manager.collection_changed("robots")
+        return {"robot_id": row["robot_id"]}
+    except (HTTPException, DatabaseUnavailable):
+        raise
     except Exception as e:
-        db_connection.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/robots/")
-async def get_robots(db=Depends(get_db)):
-    _, cursor, execute = db
-    execute("SELECT * FROM robots")
-    robots = cursor.fetchall()
+async def get_robots(request: Request, response: Response):
+    not_modified = _not_modified(request, response, "robots")
+    if not_modified is not None:
+        return not_modified
+    async with connection() as db:
+        robots = await db.fetchall(ALL_ROBOTS)
     return {"robots": robots}
 
 
@@ -316,21 +627,150 @@ class ProgressUpdate(BaseModel):
     progress: float
 
 
-@router.patch("/tasks/progress/")
-async def update_task_progress(data: ProgressUpdate, db=Depends(get_db)):
-    db_connection, db_cursor, _ = db
+@router.get("/metrics")
+async def get_metrics():
+    await metrics.collect()
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Качество связи всех соединений этого воркера: RTT и смещение часов
+@router.get("/links")
+async def get_links():
+    return {"links": manager.link_summary()}
+
+
+@router.get("/robots/{robot_id}/link")
+async def get_robot_link(robot_id: str):
+    for link in manager.link_summary():
+        if link["robot_id"] == robot_id:
+            return link
+    raise HTTPException(status_code=404, detail="Robot is not connected")
+
+
+def _chart_params(fields: str, points: int, method: str):
+    names = [f for f in fields.split(",") if f]
+    unknown = [f for f in names if f not in ROLLUP_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}")
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown method: {method}")
+    return names, max(3, min(points, TELEMETRY_MAX_POINTS))
+
+
+@router.get("/robots/{robot_id}/telemetry")
+async def get_robot_telemetry(
+    robot_id: str,
+    since: float = 0.0,
+    points: Optional[int] = None,
+    method: str = "lttb",
+    fields: str = ",".join(ROLLUP_FIELDS),
+):
+    rows = telemetry_history.since(robot_id, since)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="No telemetry for robot")
+    if points is None:
+        return {"robot_id": robot_id, "count": len(rows), **to_columns(rows)}
+    names, points = _chart_params(fields, points, method)
+    return {
+        "robot_id": robot_id,
+        "count": len(rows),
+        "series": {
+            name: series(rows[:, 0], rows[:, FIELDS.index(name)], points, method)
+            for name in names
+        },
+    }
+
+
+# История за произвольный период из базы, прореженная до points точек.
+# Длинные периоды читаются из минутных агрегатов, а не из сырых кадров
+@router.get("/robots/{robot_id}/telemetry/history")
+async def get_robot_telemetry_history(
+    robot_id: str,
+    start: float,
+    end: float,
+    points: int = 1000,
+    method: str = "lttb",
+    fields: str = ",".join(ROLLUP_FIELDS),
+    db=Depends(get_db),
+):
+    names, points = _chart_params(fields, points, method)
+    rollup = end - start > TELEMETRY_ROLLUP_AFTER
+    if rollup:
+        columns = ", ".join(f"{name}_min, {name}_max, {name}_avg" for name in names)
+        query = f"""
+        SELECT extract(epoch FROM bucket), {columns}
+        FROM telemetry_rollup_1m
+        WHERE robot_id = %s AND bucket >= to_timestamp(%s) AND bucket < to_timestamp(%s)
+        ORDER BY bucket;
+        """
+    else:
+        query = f"""
+        SELECT extract(epoch FROM ts), {", ".join(names)}
+        FROM telemetry
+        WHERE robot_id = %s AND ts >= to_timestamp(%s) AND ts < to_timestamp(%s)
+        ORDER BY ts;
+        """
+
+    def fetch(connection):
+        # Кортежи вместо словарей — сразу в массив NumPy
+        with connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.execute(query, (robot_id, start, end))
+            return np.array(cursor.fetchall(), dtype=float).reshape(
+                -1, 1 + len(names) * (3 if rollup else 1)
+            )
+
     try:
-        db_cursor.execute("SELECT * FROM tasks WHERE task_id = %s;", (data.task_id,))
-        task = db_cursor.fetchone()
-        if not task:
-            raise HTTPException(status_code=404, detail="Task not found")
-
-        db_cursor.execute(
-            "UPDATE tasks SET progress = %s WHERE task_id = %s;",
-            (data.progress, data.task_id),
-        )
-        db_connection.commit()
-        return {"status": "success"}
+        rows = await db.run(fetch)
+    except (HTTPException, DatabaseUnavailable):
+        raise
     except Exception as e:
-        db_connection.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+
+    ts = rows[:, 0]
+    result = {}
+    for i, name in enumerate(names):
+        if not rollup:
+            result[name] = series(ts, rows[:, 1 + i], points, method)
+        elif method == "minmax":
+            # Минимумы и максимумы минут — кандидаты в пики корзин
+            xs = np.column_stack([ts, ts + 30]).ravel()
+            ys = rows[:, 1 + 3 * i : 3 + 3 * i].ravel()
+            result[name] = series(xs, ys, points, method)
+        else:
+            result[name] = series(ts, rows[:, 3 + 3 * i], points, method)
+    return {
+        "robot_id": robot_id,
+        "source": "rollup_1m" if rollup else "raw",
+        "count": len(rows),
+        "series": result,
+    }
+
+
+def _buffer_progress(message: dict):
+    try:
+        task_id, progress = int(message["task_id"]), float(message["progress"])
+    except (KeyError, TypeError, ValueError):
+        return
+    progress_buffer.update(task_id, progress)
+    # Чтение задач этого воркера уже видит новый прогресс — старый ETag не годится
+    versions.bump("tasks")
+
+
+# Прогресс принимается без обращения к базе: запись — пачкой в progress_buffer.
+# Несуществующий task_id не даёт 404, пакетный UPDATE его просто не найдёт
+@router.patch("/tasks/progress/")
+async def update_task_progress(data: ProgressUpdate):
+    _buffer_progress({"task_id": data.task_id, "progress": data.progress})
+    return {"status": "success"}
+
+
+@router.get("/tasks/progress/stats")
+async def get_progress_stats():
+    return progress_buffer.stats()
+
+
+@router.get("/telemetry/stats")
+async def get_telemetry_stats():
+    if telemetry_writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **telemetry_writer.stats()}
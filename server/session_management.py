@@ -1,14 +1,22 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from uuid import UUID, uuid4
 
 import bcrypt
-from database import get_db
+import metrics
+from database import connection
 from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi_sessions.backends.implementations import InMemoryBackend
+from fastapi_sessions.backends.session_backend import BackendError, SessionBackend
 from fastapi_sessions.frontends.implementations import CookieParameters, SessionCookie
 from fastapi_sessions.session_verifier import SessionVerifier
+from log_config import get_logger
 from pydantic import BaseModel
 
+log = get_logger("sessions")
+
 expiry_time = datetime.now() + timedelta(hours=1)
 
 router = APIRouter()
@@ -22,17 +30,16 @@ def check_sessionPeriod(nowTime: datetime):
 
 
 def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
-
-
-db_connection, cursor, _ = get_db()
+    with metrics.BCRYPT_SECONDS.time():
+        return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 
-def getLogin(username: str, password: str):
+async def getLogin(username: str, password: str):
     query = "SELECT * FROM users WHERE username = %s;"
-    cursor.execute(query, (username,))
-    user = cursor.fetchone()
-    if user and verify_password(password, user["password"]):
+    async with connection() as db:
+        user = await db.fetchone(query, (username,))
+    # bcrypt занимает сотни миллисекунд — вне цикла событий и вне потоков пула
+    if user and await asyncio.to_thread(verify_password, password, user["password"]):
         return user
     return None
 
@@ -59,7 +66,87 @@ cookie = SessionCookie(
     cookie_params=cookie_params,
 )
 
-backend = InMemoryBackend[UUID, SessionData]()
+
+class PostgresBackend(SessionBackend[UUID, SessionData]):
+    """Сессии в таблице sessions — общие для всех воркеров сервера."""
+
+    def __init__(self):
+        self.ready = False
+
+    @asynccontextmanager
+    async def _db(self):
+        # Таблица создаётся при первом обращении, а не при импорте модуля
+        async with connection() as db:
+            if not self.ready:
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        session_id UUID PRIMARY KEY,
+                        data JSONB NOT NULL,
+                        expires_at TIMESTAMP NOT NULL
+                    );
+                    """)
+                self.ready = True
+            yield db
+
+    async def create(self, session_id: UUID, data: SessionData):
+        try:
+            async with self._db() as db:
+                await db.execute(
+                    "INSERT INTO sessions (session_id, data, expires_at) "
+                    "VALUES (%s, %s, %s);",
+                    (str(session_id), data.model_dump_json(), data.expiryTime),
+                )
+        except Exception as error:
+            raise BackendError(str(error))
+
+    async def read(self, session_id: UUID):
+        async with self._db() as db:
+            row = await db.fetchone(
+                "SELECT data FROM sessions WHERE session_id = %s;", (str(session_id),)
+            )
+        if not row:
+            return None
+        return SessionData.model_validate(row["data"])
+
+    async def update(self, session_id: UUID, data: SessionData):
+        async with self._db() as db:
+            updated = await db.execute(
+                "UPDATE sessions SET data = %s, expires_at = %s WHERE session_id = %s;",
+                (data.model_dump_json(), data.expiryTime, str(session_id)),
+            )
+        if not updated:
+            raise BackendError("session does not exist, cannot update")
+
+    async def delete(self, session_id: UUID):
+        async with self._db() as db:
+            await db.execute(
+                "DELETE FROM sessions WHERE session_id = %s;", (str(session_id),)
+            )
+
+
+# memory — сессии в процессе (один воркер); postgres — общие для нескольких воркеров
+if os.getenv("SESSION_BACKEND", "memory") == "postgres":
+    backend = PostgresBackend()
+else:
+    backend = InMemoryBackend[UUID, SessionData]()
+
+
+async def count_active_sessions() -> int:
+    if isinstance(backend, PostgresBackend):
+        async with backend._db() as db:
+            row = await db.fetchone(
+                "SELECT count(*) AS n FROM sessions WHERE expires_at > NOW();"
+            )
+        return row["n"]
+    now = datetime.now()
+    return sum(1 for data in backend.data.values() if data.expiryTime > now)
+
+
+async def collect_active_sessions():
+    metrics.ACTIVE_SESSIONS.set(await count_active_sessions())
+
+
+metrics.add_collector(collect_active_sessions)
 
 
 class BasicVerifier(SessionVerifier[UUID, SessionData]):
@@ -68,7 +155,7 @@ class BasicVerifier(SessionVerifier[UUID, SessionData]):
         *,
         identifier: str,
         auto_error: bool,
-        backend: InMemoryBackend[UUID, SessionData],
+        backend: SessionBackend[UUID, SessionData],
         auth_http_exception: HTTPException,
     ):
         self._identifier = identifier
@@ -108,7 +195,7 @@ verifier = BasicVerifier(
 
 @router.post("/create_session/")
 async def create_session(userData: LoginData, response: Response):
-    user = getLogin(userData.username, userData.password)
+    user = await getLogin(userData.username, userData.password)
 
     if user:
         session = uuid4()
@@ -160,15 +247,16 @@ class UserCreate(BaseModel):
 @router.post("/create_user/")
 async def create_user(userData: UserCreate):
     if userData.username and userData.password:
-        hashed_password = bcrypt.hashpw(
-            userData.password.encode(), bcrypt.gensalt()
+        hashed_password = (
+            await asyncio.to_thread(
+                bcrypt.hashpw, userData.password.encode(), bcrypt.gensalt()
+            )
         ).decode()
         query = "INSERT INTO users (username, password) VALUES (%s, %s);"
         try:
-            print((userData.username, hashed_password))
-            cursor.execute(query, (userData.username, hashed_password))
-            db_connection.commit()
+            log.info("Создание пользователя %s", userData.username)
+            async with connection() as db:
+                await db.execute(query, (userData.username, hashed_password))
             return {"message": "User created successfully"}
         except Exception as error:
-            db_connection.rollback()
             return {"message": "Failed to create user", "error": str(error)}
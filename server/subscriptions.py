@@ -0,0 +1,180 @@
+# subscriptions.py
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+# Группы полей телеметрии, на которые может подписаться оператор
+FIELD_GROUPS: Dict[str, FrozenSet[str]] = {
+    "position": frozenset(["coordinates", "speed"]),
+    "health": frozenset(
+        ["status", "camera_ok", "lidar_ok", "current_voltage", "data_exchange_latency"]
+    ),
+    "system": frozenset(["cpu_frequency", "cpu_usage", "memory_usage"]),
+    "mission": frozenset(["total_distance", "avg_distance_per_task", "trip_count"]),
+}
+
+# Поля, по которым клиент узнаёт робота, приходят при любой подписке
+IDENTITY_FIELDS = frozenset(["robot_id", "deviceName"])
+
+# (robot_ids или None = все роботы, исключённые из "всех" роботы,
+#  поля или None = все поля)
+SubscriptionKey = Tuple[
+    Optional[FrozenSet[str]], FrozenSet[str], Optional[FrozenSet[str]]
+]
+
+ALL: SubscriptionKey = (None, frozenset(), None)
+
+
+def resolve_fields(groups: Optional[Iterable[str]]) -> Optional[FrozenSet[str]]:
+    if groups is None:
+        return None
+    fields = set(IDENTITY_FIELDS)
+    for group in groups:
+        if group not in FIELD_GROUPS:
+            raise ValueError(f"Unknown field group: {group}")
+        fields |= FIELD_GROUPS[group]
+    return frozenset(fields)
+
+
+def project(patch: dict, fields: Optional[FrozenSet[str]]) -> dict:
+    if fields is None:
+        return patch
+    return {field: value for field, value in patch.items() if field in fields}
+
+
+class SubscriptionIndex:
+    """
+    Подписки операторов, сгруппированные по одинаковым ключам.
+
+    Операторы с одной и той же подпиской делят один кадр (и одно кодирование),
+    а индекс robot_id -> ключи подписок позволяет на каждом тике обходить
+    только изменившихся роботов, не фильтруя сообщения для каждого оператора.
+    """
+
+    def __init__(self):
+        self.keys: Dict[WebSocket, SubscriptionKey] = {}
+        # Оператор ещё не подписывался явно и получает всё (старое поведение)
+        self.implicit: Set[WebSocket] = set()
+        self.members: Dict[SubscriptionKey, Set[WebSocket]] = {}
+        self.by_robot: Dict[str, Set[SubscriptionKey]] = {}
+        self.wildcard: Set[SubscriptionKey] = set()
+        # Подписки на всех роботов, из которых робот исключён отпиской;
+        # роботы, подключившиеся позже или на другом воркере, в них входят
+        self.excluded_by_robot: Dict[str, Set[SubscriptionKey]] = {}
+
+    def add_default(self, websocket: WebSocket):
+        self._set(websocket, ALL)
+        self.implicit.add(websocket)
+
+    def remove(self, websocket: WebSocket):
+        key = self.keys.pop(websocket, None)
+        self.implicit.discard(websocket)
+        if key is None:
+            return
+        members = self.members[key]
+        members.discard(websocket)
+        if members:
+            return
+        del self.members[key]
+        robots, excluded, _ = key
+        if robots is None:
+            self.wildcard.discard(key)
+            self._unindex(self.excluded_by_robot, excluded, key)
+        else:
+            self._unindex(self.by_robot, robots, key)
+
+    @staticmethod
+    def _unindex(
+        index: Dict[str, Set[SubscriptionKey]],
+        robots: Iterable[str],
+        key: SubscriptionKey,
+    ):
+        for robot in robots:
+            keys = index.get(robot)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[robot]
+
+    def _set(self, websocket: WebSocket, key: SubscriptionKey):
+        self.remove(websocket)
+        self.keys[websocket] = key
+        if key not in self.members:
+            self.members[key] = set()
+            robots, excluded, _ = key
+            if robots is None:
+                self.wildcard.add(key)
+                for robot in excluded:
+                    self.excluded_by_robot.setdefault(robot, set()).add(key)
+            else:
+                for robot in robots:
+                    self.by_robot.setdefault(robot, set()).add(key)
+        self.members[key].add(websocket)
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        robot_ids: Optional[Iterable] = None,
+        groups: Optional[Iterable[str]] = None,
+    ) -> SubscriptionKey:
+        """
+        Добавляет роботов к подписке (None — все роботы). Группы полей, если
+        заданы, заменяют текущие. Первая явная подписка заменяет подписку
+        по умолчанию на всё. Для подписки на всех роботов это возврат
+        исключённых роботов.
+        """
+        current_robots, excluded, current_fields = self.keys.get(websocket, ALL)
+        if websocket in self.implicit:
+            current_robots, current_fields = frozenset(), None
+        fields = resolve_fields(groups) if groups is not None else current_fields
+        if robot_ids is None:
+            robots, excluded = None, frozenset()
+        elif current_robots is None:
+            robots, excluded = None, excluded - frozenset(map(str, robot_ids))
+        else:
+            robots = current_robots | frozenset(map(str, robot_ids))
+            excluded = frozenset()
+        self.implicit.discard(websocket)
+        key = (robots, excluded, fields)
+        self._set(websocket, key)
+        return key
+
+    def unsubscribe(
+        self,
+        websocket: WebSocket,
+        robot_ids: Optional[Iterable] = None,
+    ) -> SubscriptionKey:
+        """
+        Убирает роботов из подписки (None — всех). Подписка на всех роботов
+        остаётся таковой, а роботы запоминаются как исключённые: список
+        подключённых сейчас не подходит, роботы подключаются и позже, и на
+        других воркерах.
+        """
+        current_robots, excluded, fields = self.keys.get(websocket, ALL)
+        if robot_ids is None:
+            robots, excluded = frozenset(), frozenset()
+        elif current_robots is None:
+            robots, excluded = None, excluded | frozenset(map(str, robot_ids))
+        else:
+            robots = current_robots - frozenset(map(str, robot_ids))
+        self.implicit.discard(websocket)
+        key = (robots, excluded, fields)
+        self._set(websocket, key)
+        return key
+
+    def keys_for_robot(self, robot: str) -> Set[SubscriptionKey]:
+        keys = self.by_robot.get(robot)
+        wildcard = self.wildcard
+        excluded = self.excluded_by_robot.get(robot)
+        if excluded:
+            wildcard = wildcard - excluded
+        if not keys:
+            return wildcard
+        return wildcard | keys
+
+    @staticmethod
+    def includes(key: SubscriptionKey, robot: str) -> bool:
+        robots, excluded, _ = key
+        if robots is None:
+            return robot not in excluded
+        return robot in robots
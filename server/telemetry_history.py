@@ -0,0 +1,90 @@
+# telemetry_history.py
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Колонки кольцевого буфера; отсутствующее значение — NaN
+FIELDS = ("ts", "lat", "lng", "speed_kph", "voltage", "cpu_usage")
+
+
+class TelemetryRing:
+    """
+    Кольцевой буфер последних кадров одного робота: массив capacity x FIELDS,
+    запись перезаписывает самую старую строку. Время в буфере не убывает,
+    поэтому выборка since — бинарный поиск по двум отрезкам кольца.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.full((capacity, len(FIELDS)), np.nan)
+        self.head = 0
+        self.count = 0
+
+    def append(self, row):
+        self.data[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _segments(self) -> List[np.ndarray]:
+        # От старых к новым: хвост после head (если кольцо заполнено), затем начало
+        if self.count < self.capacity:
+            return [self.data[: self.count]]
+        return [self.data[self.head :], self.data[: self.head]]
+
+    def since(self, ts: float = 0.0) -> np.ndarray:
+        parts = []
+        for segment in self._segments():
+            start = np.searchsorted(segment[:, 0], ts, side="right")
+            if start < len(segment):
+                parts.append(segment[start:])
+        if not parts:
+            return np.empty((0, len(FIELDS)))
+        if len(parts) == 1:
+            return parts[0].copy()
+        return np.concatenate(parts)
+
+
+class TelemetryHistory:
+    """
+    Недавняя телеметрия всех роботов в памяти. Память ограничена:
+    capacity строк на робота и не больше max_robots буферов — при
+    переполнении выбрасывается буфер робота, дольше всех не присылавшего кадров.
+    """
+
+    def __init__(self, capacity: int = 3600, max_robots: int = 1000):
+        self.capacity = capacity
+        self.max_robots = max_robots
+        self.rings: "OrderedDict[str, TelemetryRing]" = OrderedDict()
+
+    def append(self, sample: tuple):
+        """sample — строка из telemetry_store.sample_from_snapshot."""
+        ts, robot, lat, lng, speed, voltage, cpu = sample[:7]
+        ring = self.rings.get(robot)
+        if ring is None:
+            if len(self.rings) >= self.max_robots:
+                self.rings.popitem(last=False)
+            ring = self.rings[robot] = TelemetryRing(self.capacity)
+        else:
+            self.rings.move_to_end(robot)
+        # None -> NaN при записи в float-массив
+        ring.append((ts, lat, lng, speed, voltage, cpu))
+
+    def since(self, robot: str, ts: float = 0.0) -> Optional[np.ndarray]:
+        ring = self.rings.get(robot)
+        if ring is None:
+            return None
+        return ring.since(ts)
+
+    def memory_bytes(self) -> int:
+        return sum(ring.data.nbytes for ring in self.rings.values())
+
+
+def to_columns(rows: np.ndarray) -> Dict[str, list]:
+    """Строки буфера -> колонки для JSON (NaN -> null)."""
+    columns = {}
+    for i, field in enumerate(FIELDS):
+        values = rows[:, i].tolist()
+        columns[field] = [None if v != v else v for v in values]
+    return columns
@@ -0,0 +1,277 @@
+# telemetry_store.py
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set
+
+import psycopg2
+from log_config import get_logger
+
+log = get_logger("telemetry")
+
+COLUMNS = (
+    "ts",
+    "robot_id",
+    "lat",
+    "lng",
+    "speed_kph",
+    "voltage",
+    "cpu_usage",
+    "memory_usage",
+    "total_distance",
+)
+
+# Поля графиков, для которых ведутся минутные агрегаты (min/max/avg)
+ROLLUP_FIELDS = ("speed_kph", "voltage", "cpu_usage")
+ROLLUP_COLUMNS = [
+    f"{field}_{agg}" for field in ROLLUP_FIELDS for agg in ("min", "max", "avg")
+]
+
+
+def _number(value) -> Optional[float]:
+    # Скорость от GPS приходит строкой, пустая строка — нет данных
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def sample_from_snapshot(robot: str, snapshot: dict, ts: float) -> tuple:
+    coordinates = snapshot.get("coordinates") or {}
+    speed = snapshot.get("speed") or {}
+    return (
+        ts,
+        robot,
+        _number(coordinates.get("lat")),
+        _number(coordinates.get("lng")),
+        _number(speed.get("kph")),
+        _number(snapshot.get("current_voltage")),
+        _number(snapshot.get("cpu_usage")),
+        _number(snapshot.get("memory_usage")),
+        _number(snapshot.get("total_distance")),
+    )
+
+
+class TelemetryWriter:
+    """
+    Буферизованная запись телеметрии в Postgres через COPY.
+
+    add() только добавляет строку в список и никогда не ждёт базу. Сброс
+    идёт при накоплении batch_size строк или раз в flush_interval секунд,
+    одним COPY в отдельном потоке со своим соединением. Пока предыдущий
+    сброс не закончился, новый не начинается; если буфер дорос до
+    max_buffer, новые строки отбрасываются и считаются в dropped.
+    Таблица telemetry секционирована по суткам, секции создаются по мере надобности.
+    """
+
+    def __init__(
+        self,
+        connection_params: dict,
+        batch_size: int = 5000,
+        flush_interval: float = 1.0,
+        max_buffer: int = 100000,
+    ):
+        self.connection_params = connection_params
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.buffer: List[tuple] = []
+        self.accepted = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self._conn = None
+        self._partitions: Set[str] = set()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._flushing: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    def add(self, sample: tuple) -> bool:
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return False
+        self.buffer.append(sample)
+        self.accepted += 1
+        if len(self.buffer) >= self.batch_size:
+            self._schedule_flush()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self.buffer),
+            "accepted": self.accepted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+    async def start(self):
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    async def _run_timer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flushing is None or self._flushing.done():
+            if self.buffer:
+                self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            await loop.run_in_executor(self._executor, self._copy, rows)
+        except Exception as e:
+            self.failed_flushes += 1
+            # Возвращаем пачку в начало буфера, если есть место; иначе теряем
+            room = self.max_buffer - len(self.buffer)
+            if room > 0:
+                self.buffer[:0] = rows[-room:]
+            self.dropped += max(0, len(rows) - max(room, 0))
+            log.error("Ошибка записи телеметрии (%d строк): %s", len(rows), e)
+            return
+        self.flushes += 1
+        self.written += len(rows)
+        self.last_flush_seconds = time.perf_counter() - started
+
+    # ===== Код ниже выполняется в потоке записи ===== #
+
+    def _connect(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(**self.connection_params)
+            self._partitions.clear()
+            with self._conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS telemetry (
+                        ts TIMESTAMPTZ NOT NULL,
+                        robot_id TEXT NOT NULL,
+                        lat DOUBLE PRECISION,
+                        lng DOUBLE PRECISION,
+                        speed_kph REAL,
+                        voltage REAL,
+                        cpu_usage REAL,
+                        memory_usage REAL,
+                        total_distance DOUBLE PRECISION
+                    ) PARTITION BY RANGE (ts);
+                    """)
+                columns = ",\n".join(f"{c} REAL" for c in ROLLUP_COLUMNS)
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS telemetry_rollup_1m (
+                        robot_id TEXT NOT NULL,
+                        bucket TIMESTAMPTZ NOT NULL,
+                        samples INTEGER NOT NULL,
+                        {columns},
+                        PRIMARY KEY (robot_id, bucket)
+                    );
+                    """)
+            self._conn.commit()
+        return self._conn
+
+    def _ensure_partition(self, cursor, day: datetime):
+        name = f"telemetry_{day:%Y%m%d}"
+        if name in self._partitions:
+            return
+        start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=1)
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF telemetry
+            FOR VALUES FROM (%s) TO (%s);
+            CREATE INDEX IF NOT EXISTS {name}_robot_ts ON {name} (robot_id, ts);
+            """,
+            (start, end),
+        )
+        self._partitions.add(name)
+
+    def _copy(self, rows: List[tuple]):
+        conn = self._connect()
+        data = io.StringIO()
+        days = set()
+        for row in rows:
+            ts = datetime.fromtimestamp(row[0], tz=timezone.utc)
+            days.add(ts.date())
+            data.write(ts.isoformat())
+            for value in row[1:]:
+                data.write("\t")
+                data.write("\\N" if value is None else str(value))
+            data.write("\n")
+        data.seek(0)
+        try:
+            with conn.cursor() as cursor:
+                for day in days:
+                    self._ensure_partition(
+                        cursor,
+                        datetime(day.year, day.month, day.day, tzinfo=timezone.utc),
+                    )
+                cursor.copy_expert(
+                    f"COPY telemetry ({', '.join(COLUMNS)}) FROM STDIN", data
+                )
+                self._update_rollups(cursor, rows)
+            conn.commit()
+        except Exception:
+            # Соединение могло порваться — следующий сброс переподключится
+            self._close()
+            raise
+
+    def _update_rollups(self, cursor, rows: List[tuple]):
+        # Минуты, затронутые пачкой, пересчитываются целиком по сырым строкам:
+        # пересчёт идемпотентен и не зависит от того, как кадры разбиты на пачки
+        robots = sorted({row[1] for row in rows})
+        start = datetime.fromtimestamp(min(row[0] for row in rows), tz=timezone.utc)
+        end = datetime.fromtimestamp(max(row[0] for row in rows), tz=timezone.utc)
+        aggregates = ", ".join(
+            f"{agg}({field})"
+            for field in ROLLUP_FIELDS
+            for agg in ("min", "max", "avg")
+        )
+        columns = ", ".join(ROLLUP_COLUMNS)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in ROLLUP_COLUMNS)
+        cursor.execute(
+            f"""
+            INSERT INTO telemetry_rollup_1m (robot_id, bucket, samples, {columns})
+            SELECT robot_id, date_trunc('minute', ts), count(*), {aggregates}
+            FROM telemetry
+            WHERE robot_id = ANY(%s)
+              AND ts >= date_trunc('minute', %s::timestamptz)
+              AND ts < date_trunc('minute', %s::timestamptz) + interval '1 minute'
+            GROUP BY 1, 2
+            ON CONFLICT (robot_id, bucket) DO UPDATE
+            SET samples = EXCLUDED.samples, {updates};
+            """,
+            (robots, start, end),
+        )
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
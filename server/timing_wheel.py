@@ -0,0 +1,52 @@
+# timing_wheel.py
+from typing import Dict, Hashable, List
+
+
+class TimingWheel:
+    """
+    Хешированное колесо таймеров: срок попадает в ячейку
+    (срок // tick) % slots. advance() обходит только ячейки прошедших тиков,
+    поэтому стоимость тика не зависит от общего числа таймеров. Сроки
+    дальше одного оборота колеса остаются в ячейке до своего оборота.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64):
+        self.tick = tick
+        self.slots = slots
+        self.buckets: List[Dict[Hashable, float]] = [{} for _ in range(slots)]
+        self.where: Dict[Hashable, int] = {}
+        self._current = None
+
+    def __len__(self):
+        return len(self.where)
+
+    def schedule(self, key: Hashable, deadline: float):
+        self.cancel(key)
+        index = int(deadline // self.tick) % self.slots
+        self.buckets[index][key] = deadline
+        self.where[key] = index
+
+    def cancel(self, key: Hashable):
+        index = self.where.pop(key, None)
+        if index is not None:
+            self.buckets[index].pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Снимает и возвращает таймеры со сроком не позже now."""
+        target = int(now // self.tick)
+        if self._current is None:
+            self._current = target
+        # После долгой паузы достаточно одного полного оборота
+        start = max(self._current, target - self.slots + 1)
+        expired = []
+        for tick in range(start, target + 1):
+            bucket = self.buckets[tick % self.slots]
+            if not bucket:
+                continue
+            for key, deadline in list(bucket.items()):
+                if deadline <= now:
+                    del bucket[key]
+                    del self.where[key]
+                    expired.append(key)
+        self._current = target
+        return expired
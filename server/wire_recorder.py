@@ -0,0 +1,167 @@
+# wire_recorder.py
+import asyncio
+import itertools
+import json
+import struct
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+
+from fastapi import WebSocket
+from log_config import get_logger
+
+log = get_logger("recorder")
+
+# Заголовок записи: вид, роль, время от начала сегмента, id соединения, длина
+RECORD = struct.Struct("<BBdII")
+
+SEGMENT = 0
+IN_TEXT = 1
+IN_BINARY = 2
+OUT_TEXT = 3
+OUT_BINARY = 4
+CLOSE = 5
+
+INBOUND = "in"
+OUTBOUND = "out"
+
+ROLES = {None: 0, "robot": 1, "operator": 2}
+ROLE_NAMES = {code: name for name, code in ROLES.items()}
+
+
+class Record(NamedTuple):
+    kind: int
+    role: Optional[str]
+    ts: float
+    conn: int
+    payload: bytes
+
+    @property
+    def inbound(self) -> bool:
+        return self.kind in (IN_TEXT, IN_BINARY)
+
+    @property
+    def binary(self) -> bool:
+        return self.kind in (IN_BINARY, OUT_BINARY)
+
+
+class WireRecorder:
+    """
+    Запись всех кадров /ws в файл, только дописыванием: каждая запись —
+    19-байтный заголовок RECORD и сам кадр как есть. Время — monotonic от
+    начала сегмента; сегмент начинается при каждом запуске сервера и
+    хранит реальное время старта.
+
+    record() только копит записи в памяти: цикл событий не ждёт диска.
+    Раз в flush_interval секунд и при остановке накопленное пишется в файл
+    в отдельном потоке. Если диск не успевает и в буфере больше max_buffer
+    байт, новые кадры отбрасываются и считаются в dropped.
+    """
+
+    def __init__(
+        self, path: str, flush_interval: float = 1.0, max_buffer: int = 64 * 2**20
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.conn_ids: Dict[WebSocket, int] = {}
+        self.roles: Dict[WebSocket, Optional[str]] = {}
+        self.frames = 0
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._file = None
+        self._started = 0.0
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._stopping = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._file = await asyncio.to_thread(open, self.path, "ab")
+        self._started = time.monotonic()
+        header = json.dumps({"started_at": time.time()}).encode()
+        self._buffer.append(RECORD.pack(SEGMENT, 0, 0.0, 0, len(header)) + header)
+        self._stopping.clear()
+        self._flusher = asyncio.create_task(self._run_flusher())
+        log.info("Запись трафика /ws в %s", self.path)
+
+    async def stop(self):
+        # Флашер дописывает остаток сам: отмена посреди записи в потоке
+        # оставила бы её выполняться параллельно с закрытием файла
+        if self._flusher is not None:
+            self._stopping.set()
+            await self._flusher
+            self._flusher = None
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    async def _run_flusher(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        chunks, self._buffer = self._buffer, []
+        self._buffered = 0
+        try:
+            await asyncio.to_thread(self._write_chunks, chunks)
+        except OSError as e:
+            log.error("Ошибка записи трафика /ws в %s: %s", self.path, e)
+
+    def _write_chunks(self, chunks: List[bytes]):
+        self._file.writelines(chunks)
+        self._file.flush()
+
+    def _write(self, kind: int, websocket: WebSocket, payload: bytes):
+        if self._file is None:
+            return
+        size = RECORD.size + len(payload)
+        if self._buffered + size > self.max_buffer:
+            if not self.dropped:
+                log.warning("Диск не успевает за записью трафика — кадры отбрасываются")
+            self.dropped += 1
+            return
+        conn = self.conn_ids.get(websocket)
+        if conn is None:
+            conn = self.conn_ids[websocket] = next(self._ids)
+        role = ROLES.get(self.roles.get(websocket), 0)
+        ts = time.monotonic() - self._started
+        self._buffer.append(RECORD.pack(kind, role, ts, conn, len(payload)) + payload)
+        self._buffered += size
+        self.frames += 1
+
+    def record(self, direction: str, websocket: WebSocket, frame: Union[str, bytes]):
+        if isinstance(frame, str):
+            kind = IN_TEXT if direction == INBOUND else OUT_TEXT
+            frame = frame.encode()
+        else:
+            kind = IN_BINARY if direction == INBOUND else OUT_BINARY
+        self._write(kind, websocket, frame)
+
+    def set_role(self, websocket: WebSocket, role: Optional[str]):
+        self.roles[websocket] = role
+
+    def close(self, websocket: WebSocket):
+        if websocket in self.conn_ids:
+            self._write(CLOSE, websocket, b"")
+        self.conn_ids.pop(websocket, None)
+        self.roles.pop(websocket, None)
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """Все записи файла по порядку; оборванный хвост (сервер упал) пропускается."""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, role, ts, conn, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield Record(kind, ROLE_NAMES.get(role), ts, conn, payload)